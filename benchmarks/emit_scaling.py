@@ -0,0 +1,104 @@
+'''Measure the cost of `logger.info` as the number of producer threads grows.
+
+Usage: python benchmarks/emit_scaling.py [--events 2000] [--shards 16]
+
+For 1 to 64 threads, each thread logs `--events` records through an
+`AsyncHttpHandler`, with the default locked emit and with the lock-free
+front end (`ConfigLog.frontend_shards`). Reported for each mode:
+
+- the CPU time spent by producer threads in each logging call, which stays
+  flat with the front end as formatting moves to the consumer thread
+- the wall-clock time of each call, including waits for the handler lock
+  and, with CPython's GIL, for the other threads
+'''
+import argparse
+import logging
+import sys
+import threading
+import time
+from unittest import mock
+
+import http_logging
+from http_logging.transport import AsyncHttpTransport
+
+
+THREAD_COUNTS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def build_handler(shards: int = None) -> logging.Handler:
+    host = http_logging.HttpHost(name='localhost')
+    transport = mock.NonCallableMock(spec=AsyncHttpTransport)
+
+    return http_logging.AsyncHttpHandler(
+        http_host=host,
+        transport_class=transport,
+        config=http_logging.ConfigLog(
+            database_path=None,
+            queued_events_flush_interval=3600,
+            queued_events_flush_count=10 ** 9,
+            frontend_shards=shards,
+        ),
+    )
+
+
+def measure(threads: int, events: int, shards: int = None) -> tuple:
+    '''Average CPU and wall-clock times, in microseconds, of each logging
+    call'''
+    handler = build_handler(shards=shards)
+
+    logger = logging.getLogger(f'benchmark-{threads}-{shards}')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.addHandler(handler)
+
+    barrier = threading.Barrier(threads)
+    cpu_times = []
+    wall_times = []
+
+    def produce():
+        barrier.wait()
+        cpu_start = time.thread_time()
+        wall_start = time.perf_counter()
+
+        for i in range(events):
+            logger.info('Event %s', i, extra={'user': 'benchmark'})
+
+        cpu_times.append(time.thread_time() - cpu_start)
+        wall_times.append(time.perf_counter() - wall_start)
+
+    producers = [threading.Thread(target=produce) for _ in range(threads)]
+    for producer in producers:
+        producer.start()
+    for producer in producers:
+        producer.join()
+
+    logger.removeHandler(handler)
+    handler.close(drain_timeout=0)
+
+    calls = threads * events
+
+    return sum(cpu_times) / calls * 1e6, sum(wall_times) / calls * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--shards', type=int, default=16)
+    args = parser.parse_args()
+
+    print('Microseconds per logging call (CPU / wall clock)')
+    print(f'{"threads":>8} {"locked":>20} {"front end":>20}')
+
+    for threads in THREAD_COUNTS:
+        locked = measure(threads, args.events)
+        frontend = measure(threads, args.events, shards=args.shards)
+
+        print(f'{threads:>8} '
+              f'{locked[0]:>9.2f} / {locked[1]:>8.2f} '
+              f'{frontend[0]:>9.2f} / {frontend[1]:>8.2f}')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
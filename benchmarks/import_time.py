@@ -0,0 +1,91 @@
+'''Check `import http_logging` against the documented import-time budget.
+
+Usage: python benchmarks/import_time.py [--budget-ms 75] [--runs 5]
+
+Each run spawns a fresh interpreter with `python -X importtime` and reads
+the cumulative time reported for the `http_logging` package. The best run
+is compared against the budget. Heavy modules that must only be loaded on
+first use are checked as well.
+'''
+import argparse
+import subprocess
+import sys
+
+
+IMPORT_TIME_BUDGET_MS = 75.0
+
+LAZY_MODULES = (
+    'requests',
+    'urllib3',
+    'logstash_async.transport',
+    'logstash_async.handler',
+    'http_logging.transport',
+    'http_logging.formatter',
+    'http_logging.handler',
+)
+
+
+def measure(statement: str = 'import http_logging') -> dict:
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+
+    timings = {}
+
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+
+        _, cumulative, module = line[len('import time:'):].split('|')
+
+        try:
+            timings[module.strip()] = int(cumulative) / 1000
+        except ValueError:  # Header line
+            continue
+
+    return timings
+
+
+def check(budget_ms: float = IMPORT_TIME_BUDGET_MS, runs: int = 5) -> list:
+    errors = []
+    best = None
+
+    for _ in range(runs):
+        timings = measure()
+
+        loaded = [module for module in LAZY_MODULES if module in timings]
+        if loaded:
+            errors.append(f'Eagerly imported: {", ".join(loaded)}')
+            return errors
+
+        elapsed = timings['http_logging']
+        best = elapsed if best is None else min(best, elapsed)
+
+    print(f'import http_logging: {best:.2f} ms (budget: {budget_ms:.2f} ms)')
+
+    if best > budget_ms:
+        errors.append(f'Import time {best:.2f} ms exceeds {budget_ms:.2f} ms')
+
+    return errors
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--budget-ms', type=float, default=IMPORT_TIME_BUDGET_MS)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    errors = check(budget_ms=args.budget_ms, runs=args.runs)
+
+    for error in errors:
+        print(error, file=sys.stderr)
+
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
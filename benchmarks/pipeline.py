@@ -0,0 +1,153 @@
+'''Compare sequential and pipelined sends of `AsyncHttpTransport`.
+
+Usage: python benchmarks/pipeline.py [--events 20000] [--batch-kib 256]
+                                     [--collector-delay 0.005]
+
+Each round ships `--events` events split in batches of `--batch-kib` KiB to
+the collector stand-in from `tests/integration/localserver.py`, run in a
+separate process. `--collector-delay` adds a fixed processing time to each
+request, as a remote collector would. Sequential sends split and encode a
+batch, then wait for the collector; pipelined sends (`pipeline_buffers`)
+prepare the next batches meanwhile. Reported: events shipped per second,
+best of `--rounds`.
+'''
+import argparse
+import json
+import multiprocessing
+import pathlib
+import random
+import sys
+import time
+
+import http_logging
+from http_logging.transport import AsyncHttpTransport
+
+
+ROOT = pathlib.Path(__file__).parent.parent.resolve()
+LOCAL_SERVER_DIRECTORY = ROOT / 'tests' / 'integration'
+
+PIPELINE_BUFFERS = (None, 1, 2, 4)
+
+
+def run_collector(port: int, delay: float) -> None:
+    from http import HTTPStatus
+    from http.server import ThreadingHTTPServer
+
+    sys.path.insert(0, str(LOCAL_SERVER_DIRECTORY))
+    from localserver import LocalHostHandler
+
+    class BenchmarkCollectorHandler(LocalHostHandler):
+
+        def do_GET(self):
+            self.body  # Read and decode the batch, as a collector would
+            time.sleep(delay)
+
+            self.send_response(code=HTTPStatus.OK)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(
+        ('127.0.0.1', port), BenchmarkCollectorHandler)
+    server.serve_forever()
+
+
+def build_events(count: int) -> list:
+    rng = random.Random(0)
+
+    return [
+        json.dumps({
+            'type': 'benchmark',
+            'message': f'Request {i} handled in {rng.random() * 100:.2f} ms',
+            'level': {'number': 20, 'name': 'INFO'},
+            'extra': {
+                'user_id': rng.randrange(10 ** 6),
+                'path': '/api/v1/items/' + str(rng.randrange(1000)),
+                'tags': [rng.choice('abcdef') * 8 for _ in range(5)],
+            },
+        })
+        for i in range(count)
+    ]
+
+
+def measure(args: argparse.Namespace, events: list, buffers: int) -> float:
+    transport = AsyncHttpTransport(
+        http_host=http_logging.HttpHost(name='127.0.0.1', port=args.port),
+        config=http_logging.ConfigLog(
+            security=http_logging.HttpSecurity(ssl_enable=False),
+            pipeline_buffers=buffers,
+            max_request_size=args.batch_kib * 1024,
+        ),
+    )
+
+    best = 0.0
+
+    for _ in range(args.rounds):
+        start = time.perf_counter()
+        transport.send(events, raise_errors=True)
+        best = max(best, len(events) / (time.perf_counter() - start))
+
+    transport.close()
+
+    return best
+
+
+def wait_for_collector(args: argparse.Namespace) -> None:
+    transport = AsyncHttpTransport(
+        http_host=http_logging.HttpHost(name='127.0.0.1', port=args.port),
+        config=http_logging.ConfigLog(
+            security=http_logging.HttpSecurity(ssl_enable=False)),
+    )
+    deadline = time.monotonic() + 10
+
+    while True:
+        try:
+            transport.send(['{}'], raise_errors=True)
+            return
+        except Exception:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--batch-kib', type=int, default=256)
+    parser.add_argument('--collector-delay', type=float, default=0.005,
+                        help='seconds spent by the collector per request')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--port', type=int, default=8770)
+    args = parser.parse_args()
+
+    collector = multiprocessing.Process(
+        target=run_collector,
+        args=(args.port, args.collector_delay),
+        daemon=True,
+    )
+    collector.start()
+
+    try:
+        wait_for_collector(args)
+        events = build_events(args.events)
+
+        print(f'{"pipeline_buffers":>16} {"events/s":>12} {"speedup":>8}')
+
+        baseline = None
+
+        for buffers in PIPELINE_BUFFERS:
+            rate = measure(args, events, buffers)
+            baseline = baseline or rate
+
+            print(f'{str(buffers):>16} {rate:>12,.0f} '
+                  f'{rate / baseline:>7.2f}x')
+    finally:
+        collector.terminate()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,431 @@
+'''Soak and load test `AsyncHttpHandler` against the local collector.
+
+Usage: python benchmarks/soak.py [--duration 60] [--rate 200] [--threads 8]
+                                 [--outage-every 30 --outage-duration 10]
+
+Producer threads log records at a fixed total rate, with payload shapes and
+exceptions drawn from a seeded random generator, so two runs with the same
+arguments log the same records. The collector is the stand-in from
+`tests/integration/localserver.py`, run in a separate process, which can be
+taken down periodically (it answers 503) to simulate outages.
+
+Every `--sample-interval` seconds, the harness reports the RSS of the
+process, the size of the SQLite cache, the events pending in the worker and
+the end-to-end delivery latency (from record creation to reception by the
+collector). Once done, every event logged must have been delivered: the run
+fails if losses, latency, memory growth, queue depth or cache size exceed
+their thresholds.
+'''
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import pathlib
+import queue
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import http_logging
+
+
+ROOT = pathlib.Path(__file__).parent.parent.resolve()
+LOCAL_SERVER_DIRECTORY = ROOT / 'tests' / 'integration'
+
+PAYLOAD_SHAPES = ('small', 'medium', 'large', 'nested')
+
+# Overall latencies are counted in buckets of 10ms up to 10 minutes, so the
+# memory used by the harness itself does not grow along the run
+LATENCY_BUCKET = 0.01
+LATENCY_BUCKETS = 60_000
+
+
+def run_collector(port: int, outage, deliveries) -> None:
+    '''Collector process: reports (sequence, latency) of events received'''
+    from http import HTTPStatus
+    from http.server import ThreadingHTTPServer
+
+    sys.path.insert(0, str(LOCAL_SERVER_DIRECTORY))
+    from localserver import LocalHostHandler
+
+    class SoakCollectorHandler(LocalHostHandler):
+
+        def do_GET(self):
+            received_at = time.time()
+
+            if outage.is_set():
+                self.send_response(code=HTTPStatus.SERVICE_UNAVAILABLE)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            events = self.body
+            deliveries.put([
+                (
+                    event['extra']['soak_seq'],
+                    received_at - event['created'],
+                )
+                for event in events
+                if 'soak_seq' in event.get('extra', {})
+            ])
+
+            self.send_response(code=HTTPStatus.OK)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass  # No access log, it would dominate the collector load
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), SoakCollectorHandler)
+    server.serve_forever()
+
+
+def build_payload(rng: random.Random, shape: str) -> dict:
+    if shape == 'small':
+        return {}
+
+    if shape == 'medium':
+        return {f'field_{i}': rng.randint(0, 10 ** 6) for i in range(10)}
+
+    if shape == 'large':
+        return {'blob': ''.join(rng.choice('abcdef') for _ in range(4096))}
+
+    nested = {'value': rng.random()}
+    for depth in range(5):
+        nested = {f'level_{depth}': nested, 'items': list(range(depth))}
+
+    return nested
+
+
+def get_rss() -> int:
+    '''Resident set size of this process, in bytes'''
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:  # Not Linux: peak RSS, in kilobytes (bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def get_cache_size(database_path: str) -> int:
+    size = 0
+
+    for suffix in ('', '-journal', '-wal'):
+        try:
+            size += os.path.getsize(database_path + suffix)
+        except OSError:
+            pass
+
+    return size
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def histogram_percentile(histogram: list, fraction: float) -> float:
+    rank = sum(histogram) * fraction
+    seen = 0
+
+    for bucket, count in enumerate(histogram):
+        seen += count
+        if count and seen >= rank:
+            return bucket * LATENCY_BUCKET
+
+    return 0.0
+
+
+class Soak:
+
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+
+        self.sequence = 0
+        self.sequence_lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+        self.delivered = bytearray()  # One flag per sequence number
+        self.delivered_count = 0
+        self.duplicates = 0
+        self.latencies = [0] * LATENCY_BUCKETS
+        self.window_latencies = []
+        self.samples = []
+
+        self.outage = multiprocessing.Event()
+        self.deliveries = multiprocessing.Queue()
+
+        self.directory = tempfile.mkdtemp(prefix='http-logging-soak-')
+        self.database_path = os.path.join(self.directory, 'soak-cache.db')
+
+        self.handler = http_logging.AsyncHttpHandler(
+            http_host=http_logging.HttpHost(
+                name='127.0.0.1',
+                port=args.port,
+                path='soak',
+            ),
+            config=http_logging.ConfigLog(
+                database_path=self.database_path,
+                security=http_logging.HttpSecurity(ssl_enable=False),
+                queued_events_flush_interval=args.flush_interval,
+                flush_max_delay=args.flush_max_delay,
+                queued_events_batch_size=args.batch_size,
+            ),
+        )
+
+        self.logger = logging.getLogger('http-logging-soak')
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.logger.addHandler(self.handler)
+
+    def next_sequence(self) -> int:
+        with self.sequence_lock:
+            self.sequence += 1
+            return self.sequence
+
+    def produce(self, index: int) -> None:
+        args = self.args
+        rng = random.Random(args.seed * 1000 + index)
+        interval = args.threads / args.rate
+        next_at = time.monotonic()
+
+        while not self.stop_event.is_set():
+            shape = rng.choice(args.payloads)
+            extra = {
+                'soak_seq': self.next_sequence(),
+                'soak_shape': shape,
+                'payload': build_payload(rng, shape),
+            }
+
+            if rng.random() < args.exception_ratio:
+                try:
+                    raise ValueError(f'Soak exception {extra["soak_seq"]}')
+                except ValueError:
+                    self.logger.exception('Soak failure', extra=extra)
+            else:
+                self.logger.info('Soak event %s', shape, extra=extra)
+
+            next_at += interval
+            self.stop_event.wait(max(next_at - time.monotonic(), 0.0))
+
+    def schedule_outages(self) -> None:
+        args = self.args
+        if not args.outage_every:
+            return
+
+        while not self.stop_event.wait(args.outage_every):
+            self.outage.set()
+            self.stop_event.wait(args.outage_duration)
+            self.outage.clear()
+
+    def collect_deliveries(self) -> None:
+        while True:
+            try:
+                batch = self.deliveries.get_nowait()
+            except queue.Empty:
+                return
+
+            for sequence, latency in batch:
+                if sequence >= len(self.delivered):
+                    self.delivered.extend(
+                        bytes(sequence + 1 - len(self.delivered)))
+
+                if self.delivered[sequence]:
+                    self.duplicates += 1
+                    continue
+
+                self.delivered[sequence] = 1
+                self.delivered_count += 1
+                self.window_latencies.append(latency)
+
+                bucket = int(max(latency, 0.0) / LATENCY_BUCKET)
+                self.latencies[min(bucket, LATENCY_BUCKETS - 1)] += 1
+
+    def sample(self, started_at: float) -> dict:
+        self.collect_deliveries()
+
+        worker = self.handler._worker_thread
+        sample = {
+            'time': round(time.monotonic() - started_at, 1),
+            'logged': self.sequence,
+            'delivered': self.delivered_count,
+            'latency_p50': percentile(self.window_latencies, 0.50),
+            'latency_p99': percentile(self.window_latencies, 0.99),
+            'rss': get_rss(),
+            'cache_size': get_cache_size(self.database_path),
+            'queue_depth': worker.pending_event_count if worker else 0,
+            'outage': self.outage.is_set(),
+        }
+
+        self.window_latencies = []
+        self.samples.append(sample)
+
+        print(
+            f'{sample["time"]:>7.1f}s {sample["logged"]:>9} '
+            f'{sample["delivered"]:>9} {sample["latency_p50"]:>7.2f}s '
+            f'{sample["latency_p99"]:>7.2f}s '
+            f'{sample["rss"] / 2 ** 20:>7.1f}MiB '
+            f'{sample["cache_size"] / 2 ** 10:>9.0f}KiB '
+            f'{sample["queue_depth"]:>7} '
+            f'{"down" if sample["outage"] else "up":>6}',
+            flush=True,
+        )
+
+        return sample
+
+    def run(self) -> dict:
+        args = self.args
+
+        collector = multiprocessing.Process(
+            target=run_collector,
+            args=(args.port, self.outage, self.deliveries),
+            daemon=True,
+        )
+        collector.start()
+        time.sleep(0.5)  # Let the collector listen
+
+        threads = [
+            threading.Thread(target=self.produce, args=(i,))
+            for i in range(args.threads)
+        ] + [threading.Thread(target=self.schedule_outages)]
+
+        print(f'{"time":>8} {"logged":>9} {"delivered":>9} {"p50":>8} '
+              f'{"p99":>8} {"rss":>10} {"cache":>12} {"queue":>7} '
+              f'{"state":>6}')
+
+        started_at = time.monotonic()
+        baseline_rss = None
+
+        try:
+            for thread in threads:
+                thread.start()
+
+            while time.monotonic() - started_at < args.duration:
+                time.sleep(args.sample_interval)
+                sample = self.sample(started_at)
+
+                if baseline_rss is None and sample['time'] >= args.warmup:
+                    baseline_rss = sample['rss']
+        finally:
+            self.stop_event.set()
+            for thread in threads:
+                thread.join()
+            self.outage.clear()
+
+        # Everything logged must reach the collector once it is back
+        result = self.handler.close(drain_timeout=args.drain_timeout)
+        self.logger.removeHandler(self.handler)
+
+        deadline = time.monotonic() + args.drain_timeout
+        while self.delivered_count < self.sequence and \
+                time.monotonic() < deadline:
+            time.sleep(0.2)
+            self.collect_deliveries()
+
+        final = self.sample(started_at)
+        collector.terminate()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+        if baseline_rss is None:
+            baseline_rss = self.samples[0]['rss']
+
+        return {
+            'logged': self.sequence,
+            'delivered': self.delivered_count,
+            'lost': self.sequence - self.delivered_count,
+            'duplicates': self.duplicates,
+            'deferred_on_close': result.deferred if result else None,
+            'latency_p50': histogram_percentile(self.latencies, 0.50),
+            'latency_p99': histogram_percentile(self.latencies, 0.99),
+            'rss_growth': max(s['rss'] for s in self.samples) - baseline_rss,
+            'max_queue_depth': max(s['queue_depth'] for s in self.samples),
+            'max_cache_size': max(s['cache_size'] for s in self.samples),
+            'final_cache_size': final['cache_size'],
+        }
+
+
+def mebibytes(value):
+    return None if value is None else value * 2 ** 20
+
+
+def check(summary: dict, args: argparse.Namespace) -> list:
+    limits = (
+        ('lost', args.max_loss, 'events lost'),
+        ('latency_p99', args.max_p99_latency, 'p99 latency (s)'),
+        ('rss_growth', mebibytes(args.max_rss_growth), 'RSS growth (bytes)'),
+        ('max_queue_depth', args.max_queue_depth, 'queue depth'),
+        ('max_cache_size', mebibytes(args.max_cache_size),
+         'cache size (bytes)'),
+    )
+
+    return [
+        f'{label}: {summary[key]:.0f} > {limit:.0f}'
+        for key, limit, label in limits
+        if limit is not None and summary[key] > limit
+    ]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=float, default=60.0)
+    parser.add_argument('--rate', type=float, default=200.0,
+                        help='records per second, all threads together')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--payloads', type=lambda v: v.split(','),
+                        default=list(PAYLOAD_SHAPES),
+                        help=f'comma-separated: {",".join(PAYLOAD_SHAPES)}')
+    parser.add_argument('--exception-ratio', type=float, default=0.01)
+    parser.add_argument('--outage-every', type=float, default=None,
+                        help='seconds between collector outages')
+    parser.add_argument('--outage-duration', type=float, default=10.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--port', type=int, default=8769)
+    parser.add_argument('--flush-interval', type=float, default=1.0)
+    parser.add_argument('--flush-max-delay', type=float, default=None,
+                        help='use the event-driven flush scheduler')
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--sample-interval', type=float, default=5.0)
+    parser.add_argument('--warmup', type=float, default=10.0,
+                        help='seconds before the RSS baseline is taken')
+    parser.add_argument('--drain-timeout', type=float, default=30.0)
+    parser.add_argument('--max-loss', type=int, default=0)
+    parser.add_argument('--max-p99-latency', type=float, default=30.0)
+    parser.add_argument('--max-rss-growth', type=float, default=50.0,
+                        help='MiB')
+    parser.add_argument('--max-queue-depth', type=int, default=None)
+    parser.add_argument('--max-cache-size', type=float, default=None,
+                        help='MiB')
+    parser.add_argument('--json', help='write samples and summary to a file')
+    args = parser.parse_args()
+
+    unknown = set(args.payloads) - set(PAYLOAD_SHAPES)
+    if unknown:
+        parser.error(f'unknown payload shapes: {", ".join(sorted(unknown))}')
+
+    soak = Soak(args)
+    summary = soak.run()
+
+    print(json.dumps(summary, indent=2))
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'summary': summary, 'samples': soak.samples}, file)
+
+    errors = check(summary, args)
+
+    for error in errors:
+        print(f'Threshold exceeded, {error}', file=sys.stderr)
+
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -38,7 +38,6 @@ setup(
         'License :: OSI Approved :: Apache Software License',
         'Natural Language :: English',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
         'Programming Language :: Python :: 3 :: Only',
@@ -47,13 +46,17 @@ setup(
     ],
     packages=find_packages(where='src'),
     package_dir={'': 'src'},
-    python_requires='>=3.6, <4',
+    python_requires='>=3.7, <4',
     install_requires=[
         'python-logstash-async>=2.2.0',
         'requests>=2.25.1',
     ],
+    entry_points={
+        'console_scripts': ['http-logging=http_logging.cli:main'],
+    },
     extras_require={
         'dev': dev_requirements,
+        'http2': ['httpx[http2]>=0.18.0'],
         'pub': publish_requirements,
     },
     project_urls={
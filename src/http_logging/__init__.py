@@ -1,15 +1,75 @@
+import importlib
+
+from .context import (
+    bind_context,
+    clear_context,
+    get_context,
+    log_context,
+    reset_context,
+    unbind_context,
+)
 from .secondary_classes import (
     ConfigLog,
+    FlushResult,
     HttpHost,
+    HttpHostGroup,
+    HttpLogSchema,
+    HttpRollup,
     HttpSecurity,
+    MaintenanceReport,
     SupportClass,
 )
 
 
+# Heavy classes pull `logstash_async`, `requests` and `urllib3` in. They are
+# only imported on first attribute access to keep `import http_logging` cheap.
+_LAZY_ATTRIBUTES = {
+    'AsyncHttpHandler': 'http_logging.handler',
+    'AsyncHttpTransport': 'http_logging.transport',
+    'HttpDispatcher': 'http_logging.dispatcher',
+    'HttpLogFormatter': 'http_logging.formatter',
+}
+
+
+def __getattr__(name: str):
+    module_path = _LAZY_ATTRIBUTES.get(name)
+
+    if module_path is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+    value = getattr(importlib.import_module(module_path), name)
+    globals()[name] = value
+
+    return value
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + list(_LAZY_ATTRIBUTES.keys()))
+
+
 __all__ = [
+    # Context
+    'bind_context',
+    'clear_context',
+    'get_context',
+    'log_context',
+    'reset_context',
+    'unbind_context',
+
     # Secondary classes
     'ConfigLog',
+    'FlushResult',
     'HttpHost',
+    'HttpHostGroup',
+    'HttpLogSchema',
+    'HttpRollup',
     'HttpSecurity',
+    'MaintenanceReport',
     'SupportClass',
+
+    # Lazily imported
+    'AsyncHttpHandler',
+    'AsyncHttpTransport',
+    'HttpDispatcher',
+    'HttpLogFormatter',
 ]
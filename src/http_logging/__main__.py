@@ -0,0 +1,6 @@
+import sys
+
+from http_logging.cli import main
+
+
+sys.exit(main())
@@ -0,0 +1,387 @@
+import os
+import sqlite3
+import threading
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+import weakref
+
+from logstash_async.database import DatabaseCache
+from logstash_async.memory_cache import MemoryCache
+
+import http_logging.constants as constants
+
+
+# `PRAGMA auto_vacuum` mode releasing free pages on demand
+AUTO_VACUUM_INCREMENTAL = 2
+
+# Cache file and destination of the live handlers and dispatchers
+_cache_owners = weakref.WeakKeyDictionary()
+_cache_owners_lock = threading.Lock()
+
+
+def claim_cache_path(owner, path: Optional[str], destination: str) -> None:
+    '''Reserve the SQLite cache at `path` for the events of `destination`.
+
+    Workers ship every event of their cache, so owners shipping to other
+    destinations must not use the same file: raises ValueError if one does.
+    '''
+    if not path:
+        return
+
+    path = os.path.abspath(path)
+
+    with _cache_owners_lock:
+        for other, (other_path, other_destination) in _cache_owners.items():
+            if other is not owner and other_path == path and \
+                    other_destination != destination:
+                raise ValueError(
+                    f'{path} is already the cache of events for '
+                    f'{other_destination}, set a distinct database_path '
+                    f'for {destination}'
+                )
+
+        _cache_owners[owner] = (path, destination)
+
+
+def release_cache_path(owner) -> None:
+    with _cache_owners_lock:
+        _cache_owners.pop(owner, None)
+
+
+class HttpDatabaseCache(DatabaseCache):
+    '''SQLite cache using per-instance batch size and timeout settings'''
+
+    # Columns of the rows returned for shipping
+    event_columns = '`event_id`, `event_text`'
+
+    def __init__(
+        self,
+        path: str,
+        event_ttl: int = None,
+        batch_size: int = constants.QUEUED_EVENTS_BATCH_SIZE,
+        timeout: float = constants.DATABASE_TIMEOUT,
+    ):
+        super().__init__(path=path, event_ttl=event_ttl)
+
+        self._batch_size = batch_size
+        self._timeout = timeout
+
+    def _open(self):
+        self._connection = sqlite3.connect(
+            self._database_path,
+            timeout=self._timeout,
+            isolation_level='EXCLUSIVE',
+        )
+        self._connection.row_factory = sqlite3.Row
+        self._initialize_schema()
+
+    def _initialize_schema(self):
+        # Only effective on new caches, before any table is created
+        self._connection.execute(
+            f'PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL};')
+        super()._initialize_schema()
+
+    def get_queued_events(self):
+        query_fetch = f'''
+            SELECT {self.event_columns} FROM `event`
+            WHERE `pending_delete` = 0 LIMIT ?;'''
+        query_update_base = \
+            'UPDATE `event` SET `pending_delete`=1 WHERE `event_id` IN (%s);'
+
+        with self._connect() as connection:
+            cursor = connection.cursor()
+            cursor.execute(query_fetch, (self._batch_size,))
+            events = cursor.fetchall()
+            self._bulk_update_events(cursor, events, query_update_base)
+
+        return events
+
+    def delete_events(self, events: list) -> None:
+        query_delete_base = 'DELETE FROM `event` WHERE `event_id` IN (%s);'
+
+        with self._connect() as connection:
+            cursor = connection.cursor()
+            self._bulk_update_events(cursor, events, query_delete_base)
+
+    def get_stats(self) -> dict:
+        '''Depth, age (in seconds) and size (in bytes) of the cache'''
+        query_events = '''
+            SELECT
+                SUM(`pending_delete` = 0) AS `pending`,
+                SUM(`pending_delete` = 1) AS `in_flight`,
+                (julianday('now') - julianday(MIN(`entry_date`))) * 86400
+                    AS `oldest_age`,
+                (julianday('now') - julianday(MAX(`entry_date`))) * 86400
+                    AS `newest_age`
+            FROM `event`;'''
+
+        with self._connect() as connection:
+            cursor = connection.cursor()
+            stats = dict(cursor.execute(query_events).fetchone())
+            stats['size'] = self._get_size(cursor)
+            page_size = cursor.execute('PRAGMA page_size;').fetchone()[0]
+            free_pages = \
+                cursor.execute('PRAGMA freelist_count;').fetchone()[0]
+
+        stats['pending'] = stats['pending'] or 0
+        stats['in_flight'] = stats['in_flight'] or 0
+        stats['free_size'] = page_size * free_pages
+
+        return stats
+
+    def expire_event_chunk(self, limit: int) -> int:
+        '''Delete up to `limit` events older than the TTL, returns the count
+        deleted. Small chunks keep the database lock short.'''
+        if not self._event_ttl:
+            return 0
+
+        query_delete = '''
+            DELETE FROM `event` WHERE `event_id` IN (
+                SELECT `event_id` FROM `event`
+                WHERE `entry_date` < datetime('now', ?) LIMIT ?);'''
+
+        with self._connect() as connection:
+            cursor = connection.cursor()
+            cursor.execute(
+                query_delete, (f'-{int(self._event_ttl)} seconds', limit))
+            return cursor.rowcount
+
+    def incremental_vacuum(self, pages: int) -> int:
+        '''Release up to `pages` free pages to the file system, returns the
+        count of bytes reclaimed.
+
+        Caches created without incremental auto-vacuum are converted with a
+        full `VACUUM`, which only happens once they are empty, when it is
+        cheap.
+        '''
+        with self._connect() as connection:
+            cursor = connection.cursor()
+            size_before = self._get_size(cursor)
+            auto_vacuum = cursor.execute('PRAGMA auto_vacuum;').fetchone()[0]
+
+            if auto_vacuum == AUTO_VACUUM_INCREMENTAL:
+                cursor.execute(f'PRAGMA incremental_vacuum({int(pages)});')
+                cursor.fetchall()  # Run every step of the pragma
+            elif cursor.execute('SELECT 1 FROM `event` LIMIT 1;').fetchone():
+                return 0
+            else:
+                cursor.execute(
+                    f'PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL};')
+                cursor.execute('VACUUM;')
+
+            # Converting may add a pointer-map page: never below 0
+            return max(size_before - self._get_size(cursor), 0)
+
+    def optimize(self) -> None:
+        with self._connect() as connection:
+            connection.execute('PRAGMA optimize;')
+
+    def get_size(self) -> int:
+        with self._connect() as connection:
+            return self._get_size(connection.cursor())
+
+    def _get_size(self, cursor: sqlite3.Cursor) -> int:
+        page_size = cursor.execute('PRAGMA page_size;').fetchone()[0]
+        page_count = cursor.execute('PRAGMA page_count;').fetchone()[0]
+
+        return page_size * page_count
+
+    def iter_pending_event_chunks(
+        self,
+        chunk_size: int,
+    ) -> Iterator[List[sqlite3.Row]]:
+        '''Stream pending events in `event_id` order, `chunk_size` at a time.
+
+        Each chunk is read in its own short statement, continuing after the
+        last ID seen (keyset pagination), so no lock is held on the database
+        between chunks and events added meanwhile are streamed as well.
+        '''
+        query_fetch = f'''
+            SELECT {self.event_columns} FROM `event`
+            WHERE `pending_delete` = 0 AND `event_id` > ?
+            ORDER BY `event_id` LIMIT ?;'''
+
+        last_event_id = 0
+
+        while True:
+            with self._connect() as connection:
+                cursor = connection.cursor()
+                cursor.execute(query_fetch, (last_event_id, chunk_size))
+                events = cursor.fetchall()
+
+            if not events:
+                return
+
+            last_event_id = events[-1]['event_id']
+
+            yield events
+
+    def delete_event_ids(self, event_ids: List[int]) -> None:
+        '''Delete exactly these events, in statements of a bounded number of
+        IDs. Events read before another worker took them in flight are not
+        skipped, unlike a range.'''
+        self.delete_events([(event_id,) for event_id in event_ids])
+
+
+class HttpMemoryCache(MemoryCache):
+    '''In-memory cache using a per-instance batch size'''
+
+    def __init__(
+        self,
+        cache: dict,
+        event_ttl: int = None,
+        batch_size: int = constants.QUEUED_EVENTS_BATCH_SIZE,
+    ):
+        super().__init__(cache=cache, event_ttl=event_ttl)
+
+        self._batch_size = batch_size
+
+    def get_queued_events(self):
+        events = []
+
+        for event in self._cache.values():
+            if event['pending_delete']:
+                continue
+
+            event['pending_delete'] = True
+            events.append(event)
+
+            if len(events) >= self._batch_size:
+                break
+
+        return events
+
+    def delete_events(self, events: list) -> None:
+        self._delete_events([event['id'] for event in events])
+
+
+class PartitionedDatabaseCache(HttpDatabaseCache):
+    '''SQLite cache shared by several streams, one per destination.
+
+    Events are added as `(stream, event)` tuples. Each batch only holds
+    events of a single stream, taken in turns among those currently
+    returned by `streams`: events of other streams are left in the cache.
+    Rows returned for shipping carry their `stream`.
+    '''
+
+    event_columns = '`event_id`, `event_text`, `stream`'
+
+    def __init__(
+        self,
+        *args,
+        streams: Callable[[], Iterable[str]],
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+
+        self._streams = streams
+        self._last_stream = None
+        self._stream_column_ready = False
+
+    def _initialize_schema(self):
+        super()._initialize_schema()
+
+        if self._stream_column_ready:
+            return
+
+        cursor = self._connection.cursor()
+        columns = [row[1] for row in cursor.execute(
+            'PRAGMA table_info(`event`);')]
+
+        if 'stream' not in columns:
+            cursor.execute(
+                "ALTER TABLE `event` ADD COLUMN `stream` TEXT NOT NULL "
+                "DEFAULT '';")
+
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS `idx_stream` '
+            'ON `event` (`stream`, `pending_delete`);')
+
+        self._stream_column_ready = True
+
+    def add_event(self, event: Tuple[str, str]) -> None:
+        stream, event_text = event
+        query = '''
+            INSERT INTO `event`
+            (`event_text`, `pending_delete`, `entry_date`, `stream`)
+            VALUES (?, 0, datetime('now'), ?);'''
+
+        with self._connect() as connection:
+            connection.execute(query, (event_text, stream))
+
+    def get_queued_events(self):
+        query_fetch = f'''
+            SELECT {self.event_columns} FROM `event`
+            WHERE `stream` = ? AND `pending_delete` = 0 LIMIT ?;'''
+        query_update_base = \
+            'UPDATE `event` SET `pending_delete`=1 WHERE `event_id` IN (%s);'
+
+        with self._connect() as connection:
+            cursor = connection.cursor()
+
+            for stream in next_streams(self._streams(), self._last_stream):
+                cursor.execute(query_fetch, (stream, self._batch_size))
+                events = cursor.fetchall()
+
+                if events:
+                    self._last_stream = stream
+                    self._bulk_update_events(
+                        cursor, events, query_update_base)
+                    return events
+
+        return []
+
+
+class PartitionedMemoryCache(HttpMemoryCache):
+    '''In-memory counterpart of `PartitionedDatabaseCache`'''
+
+    def __init__(
+        self,
+        *args,
+        streams: Callable[[], Iterable[str]],
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+
+        self._streams = streams
+        self._last_stream = None
+
+    def get_queued_events(self):
+        # Events are cached as `(stream, event)` tuples, batches are
+        # returned as rows with separate `stream` and `event_text` keys
+        for stream in next_streams(self._streams(), self._last_stream):
+            events = []
+
+            for event in self._cache.values():
+                if event['pending_delete'] or \
+                        event['event_text'][0] != stream:
+                    continue
+
+                event['pending_delete'] = True
+                events.append({
+                    **event,
+                    'stream': stream,
+                    'event_text': event['event_text'][1],
+                })
+
+                if len(events) >= self._batch_size:
+                    break
+
+            if events:
+                self._last_stream = stream
+                return events
+
+        return []
+
+
+def next_streams(
+    streams: Iterable[str],
+    last_stream: Optional[str],
+) -> List[str]:
+    '''Streams in turn, starting after the last one served'''
+    streams = sorted(streams)
+
+    for index, stream in enumerate(streams):
+        if last_stream is not None and stream > last_stream:
+            return streams[index:] + streams[:index]
+
+    return streams
@@ -0,0 +1,360 @@
+'''Offline tools for the SQLite cache: `python -m http_logging --help`
+
+- `inspect`: depth, age and size of a cache
+- `export`: write pending events to gzip-compressed NDJSON files
+- `replay`: ship exported files, or a copied cache, to a collector
+'''
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import functools
+import gzip
+import os
+import sys
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import http_logging
+import http_logging.constants as constants
+from http_logging.cache import HttpDatabaseCache
+from http_logging.transport import AsyncHttpTransport
+
+
+SQLITE_HEADER = b'SQLite format 3\x00'
+EXPORT_SUFFIX = '.ndjson.gz'
+NDJSON_SUFFIXES = ('.ndjson', '.ndjson.gz', '.jsonl', '.jsonl.gz')
+
+# A batch of event texts, and what to do once it has been shipped
+Batch = Tuple[List[str], Optional[Callable[[], None]]]
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='python -m http_logging',
+        description='Inspect, export and replay http_logging caches.',
+    )
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    inspect = commands.add_parser(
+        'inspect', help='show depth, age and size of a cache')
+    inspect.add_argument(
+        'database', nargs='?', default=constants.DATABASE_PATH,
+        help='SQLite cache (default: %(default)s)')
+    inspect.set_defaults(run=inspect_command)
+
+    export = commands.add_parser(
+        'export', help='write pending events to compressed NDJSON files')
+    export.add_argument(
+        'database', nargs='?', default=constants.DATABASE_PATH,
+        help='SQLite cache (default: %(default)s)')
+    export.add_argument(
+        '-o', '--output', default='.',
+        help='directory of the exported files (default: current directory)')
+    export.add_argument(
+        '--prefix', default='events',
+        help='file name prefix (default: %(default)s)')
+    export.add_argument(
+        '--events-per-file', type=int, default=100_000,
+        help='events per file (default: %(default)s)')
+    export.add_argument(
+        '--delete', action='store_true',
+        help='delete events from the cache once their file is written')
+    export.add_argument(
+        '--encoding', default=constants.ENCODING,
+        help='encoding of the cached events (default: %(default)s)')
+    export.set_defaults(run=export_command)
+
+    replay = commands.add_parser(
+        'replay', help='ship exported files or a cache to a collector')
+    replay.add_argument(
+        'sources', nargs='+',
+        help='NDJSON files (optionally gzipped), directories of them or '
+             'SQLite caches')
+    replay.add_argument('--host', required=True, help='collector host name')
+    replay.add_argument('--port', type=int, help='collector port')
+    replay.add_argument('--path', help='collector URL path')
+    replay.add_argument(
+        '--timeout', type=float, default=constants.TIMEOUT,
+        help='request timeout in seconds (default: %(default)s)')
+    replay.add_argument(
+        '--no-ssl', dest='ssl_enable', action='store_false',
+        help='use HTTP instead of HTTPS')
+    replay.add_argument(
+        '--no-ssl-verify', dest='ssl_verify', action='store_false',
+        help='do not verify the collector certificate')
+    replay.add_argument(
+        '--batch-size', type=int, default=1000,
+        help='events per request (default: %(default)s)')
+    replay.add_argument(
+        '--concurrency', type=int, default=8,
+        help='requests in flight (default: %(default)s)')
+    replay.add_argument(
+        '--delete', action='store_true',
+        help='delete events shipped from a SQLite cache')
+    replay.add_argument(
+        '--encoding', default=constants.ENCODING,
+        help='encoding of the cached events (default: %(default)s)')
+    replay.set_defaults(run=replay_command)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    try:
+        return args.run(args)
+    except (OSError, ValueError) as exc:
+        print(f'error: {exc}', file=sys.stderr)
+        return 1
+
+
+def open_cache(path: str, batch_size: int = 1000) -> HttpDatabaseCache:
+    if not is_sqlite_file(path):
+        raise ValueError(f'{path} is not a SQLite cache')
+
+    return HttpDatabaseCache(path=path, batch_size=batch_size)
+
+
+def is_sqlite_file(path: str) -> bool:
+    if not os.path.isfile(path):
+        return False
+
+    with open(path, 'rb') as file:
+        return file.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+
+
+def inspect_command(args: argparse.Namespace) -> int:
+    stats = open_cache(args.database).get_stats()
+
+    print(f'Cache:      {args.database}')
+    print(f'Pending:    {stats["pending"]} events')
+    print(f'In flight:  {stats["in_flight"]} events')
+    print(f'Oldest:     {format_age(stats["oldest_age"])}')
+    print(f'Newest:     {format_age(stats["newest_age"])}')
+    print(f'Size:       {format_size(stats["size"])} '
+          f'({format_size(stats["free_size"])} free)')
+
+    return 0
+
+
+def export_command(args: argparse.Namespace) -> int:
+    if args.events_per_file < 1:
+        raise ValueError('--events-per-file must be positive')
+
+    cache = open_cache(args.database)
+    os.makedirs(args.output, exist_ok=True)
+
+    chunk_size = min(args.events_per_file, 1000)
+    chunks = cache.iter_pending_event_chunks(chunk_size=chunk_size)
+
+    file = None
+    file_count = 0
+    event_count = 0
+    file_events = 0
+    event_ids = []
+
+    def close_file():
+        file.close()
+
+        if args.delete:
+            cache.delete_event_ids(event_ids)
+
+    for chunk in chunks:
+        for event in chunk:
+            line = decode_event(event['event_text'], args.encoding)
+            line = line.replace('\n', ' ') + '\n'
+
+            if file is None:
+                file_count += 1
+                name = f'{args.prefix}-{file_count:05d}{EXPORT_SUFFIX}'
+                # 'x': never overwrite a previous export
+                file = gzip.open(os.path.join(args.output, name), 'xt',
+                                 encoding=constants.ENCODING)
+                event_ids = []
+                file_events = 0
+
+            file.write(line)
+            event_ids.append(event['event_id'])
+            file_events += 1
+            event_count += 1
+
+            if file_events >= args.events_per_file:
+                close_file()
+                file = None
+
+    if file is not None:
+        close_file()
+
+    print(f'Exported {event_count} events to {file_count} files in '
+          f'{args.output}')
+
+    return 0
+
+
+def replay_command(args: argparse.Namespace) -> int:
+    if args.batch_size < 1 or args.concurrency < 1:
+        raise ValueError('--batch-size and --concurrency must be positive')
+
+    transport = AsyncHttpTransport(
+        http_host=http_logging.HttpHost(
+            name=args.host,
+            port=args.port,
+            path=args.path,
+            timeout=args.timeout,
+        ),
+        config=http_logging.ConfigLog(
+            use_logging=False,
+            security=http_logging.HttpSecurity(
+                ssl_enable=args.ssl_enable,
+                ssl_verify=args.ssl_verify,
+            ),
+        ),
+    )
+
+    shipped, failed = replay_batches(
+        transport=transport,
+        batches=iter_batches(
+            args.sources, args.batch_size, args.delete, args.encoding),
+        concurrency=args.concurrency,
+    )
+
+    print(f'Shipped {shipped} events to {transport.url}, {failed} failed')
+
+    return 1 if failed else 0
+
+
+def replay_batches(
+    transport: AsyncHttpTransport,
+    batches: Iterator[Batch],
+    concurrency: int,
+) -> Tuple[int, int]:
+    '''Send batches with up to `concurrency` requests in flight, returns the
+    count of events shipped and failed'''
+    shipped = failed = 0
+    in_flight = {}
+
+    def collect(futures):
+        nonlocal shipped, failed
+
+        for future in futures:
+            events, on_shipped = in_flight.pop(future)
+            exc = future.exception()
+
+            if exc is not None:
+                failed += len(events)
+                print(f'error: batch of {len(events)} events failed: {exc}',
+                      file=sys.stderr)
+                continue
+
+            shipped += len(events)
+
+            if on_shipped is not None:
+                on_shipped()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for events, on_shipped in batches:
+            if len(in_flight) >= concurrency:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+
+            future = executor.submit(transport.send, events, raise_errors=True)
+            in_flight[future] = (events, on_shipped)
+
+        collect(wait(in_flight).done)
+
+    return shipped, failed
+
+
+def iter_batches(
+    sources: List[str],
+    batch_size: int,
+    delete: bool = False,
+    encoding: str = constants.ENCODING,
+) -> Iterator[Batch]:
+    for path in iter_source_files(sources):
+        if is_sqlite_file(path):
+            yield from iter_cache_batches(path, batch_size, delete, encoding)
+        else:
+            yield from iter_ndjson_batches(path, batch_size)
+
+
+def iter_source_files(sources: List[str]) -> Iterator[str]:
+    for source in sources:
+        if not os.path.isdir(source):
+            yield source
+            continue
+
+        for name in sorted(os.listdir(source)):
+            if name.endswith(NDJSON_SUFFIXES):
+                yield os.path.join(source, name)
+
+
+def iter_cache_batches(
+    path: str,
+    batch_size: int,
+    delete: bool,
+    encoding: str = constants.ENCODING,
+) -> Iterator[Batch]:
+    cache = open_cache(path)
+
+    for chunk in cache.iter_pending_event_chunks(chunk_size=batch_size):
+        on_shipped = None
+
+        if delete:
+            on_shipped = functools.partial(
+                cache.delete_event_ids,
+                [event['event_id'] for event in chunk],
+            )
+
+        yield [
+            decode_event(event['event_text'], encoding) for event in chunk
+        ], on_shipped
+
+
+def iter_ndjson_batches(path: str, batch_size: int) -> Iterator[Batch]:
+    opener = gzip.open if path.endswith('.gz') else open
+    batch = []
+
+    with opener(path, 'rt', encoding=constants.ENCODING) as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+
+            batch.append(line)
+
+            if len(batch) >= batch_size:
+                yield batch, None
+                batch = []
+
+    if batch:
+        yield batch, None
+
+
+def decode_event(event_text, encoding: str) -> str:
+    '''Text of a cached event: handlers cache encoded, newline-terminated
+    events'''
+    if isinstance(event_text, bytes):
+        event_text = event_text.decode(encoding)
+
+    return event_text.rstrip('\n')
+
+
+def format_age(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return '-'
+
+    for unit, size in (('d', 86400), ('h', 3600), ('m', 60)):
+        if seconds >= size:
+            return f'{seconds / size:.1f}{unit} ago'
+
+    return f'{max(seconds, 0):.0f}s ago'
+
+
+def format_size(size: int) -> str:
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024 or unit == 'GiB':
+            break
+        size /= 1024
+
+    return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
@@ -1,30 +1,42 @@
 import os
 import sys
 
-from logstash_async.constants import constants as logstash_constants
-
 
 HTTP_PORT = int(os.environ.get('ASYNC_LOG_HTTP_PORT', 80))
 HTTPS_PORT = int(os.environ.get('ASYNC_LOG_HTTPS_PORT', 443))
 DATABASE_PATH = os.environ.get('ASYNC_LOG_DATABASE_PATH', 'logging-cache.db')
+DISPATCHER_DATABASE_PATH = os.environ.get(
+    'ASYNC_LOG_DISPATCHER_DATABASE_PATH', 'logging-dispatcher-cache.db')
 TIMEOUT = float(os.environ.get('ASYNC_LOG_TIMEOUT', 5.0))
 ENCODING = os.environ.get('ASYNC_LOG_ENCODING', sys.getfilesystemencoding())
 
+# Seconds to reuse `custom_headers` before calling it again (0: every batch)
+CUSTOM_HEADERS_TTL = float(os.environ.get('ASYNC_LOG_CUSTOM_HEADERS_TTL', 0.0))
+
+
+# HttpHostGroup load balancing strategies
+ROUND_ROBIN = 'round_robin'
+LEAST_LATENCY = 'least_latency'
+FAILOVER = 'failover'
+LOAD_BALANCING_STRATEGIES = (ROUND_ROBIN, LEAST_LATENCY, FAILOVER)
+
+
+# Default upper bounds of `HttpRollup` histogram buckets, e.g. milliseconds
+ROLLUP_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
 
-# Override LogStash constants
-logstash_constants.SOCKET_TIMEOUT = TIMEOUT
 
-logstash_constants.QUEUE_CHECK_INTERVAL = float(
+# Defaults for the per-handler queue settings (see `ConfigLog`)
+QUEUE_CHECK_INTERVAL = float(
     os.environ.get('ASYNC_LOG_QUEUE_CHECK_INTERVAL', 1.0))
 
-logstash_constants.QUEUED_EVENTS_FLUSH_INTERVAL = float(
+QUEUED_EVENTS_FLUSH_INTERVAL = float(
     os.environ.get('ASYNC_LOG_QUEUED_EVENTS_FLUSH_INTERVAL', 5.0))
 
-logstash_constants.QUEUED_EVENTS_FLUSH_COUNT = int(
+QUEUED_EVENTS_FLUSH_COUNT = int(
     os.environ.get('ASYNC_LOG_QUEUED_EVENTS_FLUSH_COUNT', 10))
 
-logstash_constants.QUEUED_EVENTS_BATCH_SIZE = int(
+QUEUED_EVENTS_BATCH_SIZE = int(
     os.environ.get('ASYNC_LOG_QUEUED_EVENTS_BATCH_SIZE', 10))
 
-logstash_constants.DATABASE_TIMEOUT = float(
+DATABASE_TIMEOUT = float(
     os.environ.get('ASYNC_LOG_DATABASE_TIMEOUT', 2.5))
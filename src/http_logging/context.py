@@ -0,0 +1,67 @@
+import contextlib
+import contextvars
+import json
+from typing import Iterator
+
+
+class LogContext:
+    '''Immutable snapshot of the bound fields and their JSON encoding.
+
+    Fields are encoded once, when bound, and spliced as-is into each event
+    by `HttpLogFormatter`.
+    '''
+
+    __slots__ = ('fields', 'encoded')
+
+    def __init__(self, fields: dict) -> None:
+        self.fields = fields
+        self.encoded = json.dumps(fields, default=repr) if fields else None
+
+
+EMPTY_CONTEXT = LogContext(fields={})
+
+_log_context = contextvars.ContextVar(
+    'http_logging_context',
+    default=EMPTY_CONTEXT,
+)
+
+
+def get_log_context() -> LogContext:
+    return _log_context.get()
+
+
+def get_context() -> dict:
+    return dict(_log_context.get().fields)
+
+
+def bind_context(**fields) -> contextvars.Token:
+    '''Add fields to the current context, returns a token for `reset_context`
+    '''
+    current = _log_context.get().fields
+    return _log_context.set(LogContext(fields={**current, **fields}))
+
+
+def unbind_context(*keys: str) -> contextvars.Token:
+    current = _log_context.get().fields
+    return _log_context.set(LogContext(fields={
+        key: value for key, value in current.items() if key not in keys
+    }))
+
+
+def reset_context(token: contextvars.Token) -> None:
+    _log_context.reset(token)
+
+
+def clear_context() -> contextvars.Token:
+    return _log_context.set(EMPTY_CONTEXT)
+
+
+@contextlib.contextmanager
+def log_context(**fields) -> Iterator[dict]:
+    '''Bind fields for the duration of a `with` block'''
+    token = bind_context(**fields)
+
+    try:
+        yield get_context()
+    finally:
+        reset_context(token)
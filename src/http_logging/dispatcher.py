@@ -0,0 +1,295 @@
+from collections import defaultdict
+import dataclasses
+import logging
+import threading
+from typing import List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import http_logging
+import http_logging.constants as constants
+from http_logging.cache import (
+    PartitionedDatabaseCache,
+    PartitionedMemoryCache,
+    claim_cache_path,
+)
+from http_logging.http2 import Http2Session
+from http_logging.transport import AsyncHttpTransport
+from http_logging.worker import AsyncHttpWorker
+
+
+logger = logging.getLogger('http-logging')
+
+
+class DispatchingWorker(AsyncHttpWorker):
+    '''Worker shipping the events of every handler of an `HttpDispatcher`.
+
+    Events are `(stream, event)` tuples, the stream being the URL of their
+    destination. Each upload only holds events of one stream, sent through
+    the transport registered for it.
+    '''
+
+    def __init__(self, *args, dispatcher: 'HttpDispatcher', **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self._dispatcher = dispatcher
+
+    def _open_cache(self):
+        if self._database_path:
+            return PartitionedDatabaseCache(
+                path=self._database_path,
+                event_ttl=self._event_ttl,
+                batch_size=self.config.queued_events_batch_size,
+                timeout=self.config.database_timeout,
+                streams=self._dispatcher.streams,
+            )
+
+        return PartitionedMemoryCache(
+            cache=self._memory_cache,
+            event_ttl=self._event_ttl,
+            batch_size=self.config.queued_events_batch_size,
+            streams=self._dispatcher.streams,
+        )
+
+    def _backlog_reached(self) -> bool:
+        # Backlog chunks are taken by ID range, across streams, including
+        # those of handlers not registered (yet) in this process
+        return False
+
+    def _event_size(self, event) -> int:
+        return len(event[1])
+
+    def _supports_concurrent_sends(self) -> bool:
+        return all(
+            isinstance(self._dispatcher.get_transport(stream),
+                       AsyncHttpTransport)
+            for stream in self._dispatcher.streams()
+        )
+
+    def _send_queued_events(self, queued_events: list) -> None:
+        self._send_events([
+            (event['stream'], event['event_text'])
+            for event in queued_events
+        ])
+
+    def _send_events(self, events):
+        batches = defaultdict(list)
+        for stream, event in events:
+            batches[stream].append(event)
+
+        error = None
+
+        # A failing destination does not hold the others back, its events
+        # are requeued along with those of the whole call
+        for stream, batch in batches.items():
+            try:
+                self._send_stream_events(stream, batch)
+            except Exception as exc:
+                error = error or exc
+
+        if error is not None:
+            raise error
+
+    def _send_stream_events(self, stream: str, events: List[str]) -> None:
+        transport = self._dispatcher.get_transport(stream)
+
+        if transport is None:
+            raise ValueError(f'No transport registered for {stream}')
+
+        if not isinstance(transport, AsyncHttpTransport):
+            transport.send(events, use_logging=not self._shutdown_requested())
+            return
+
+        transport.send(
+            events,
+            use_logging=not self._shutdown_requested(),
+            raise_errors=True,
+        )
+
+
+class HttpDispatcher:
+    '''One worker, cache and connection pool shared by `AsyncHttpHandler`
+    instances created with `dispatcher=`.
+
+    Events of handlers shipping to the same URL are uploaded together,
+    through the transport of the first of them to be created. Queue, flush
+    and cache settings are read from the dispatcher `config`, not from the
+    handlers'.
+    '''
+
+    def __init__(self, config: Optional[http_logging.ConfigLog] = None):
+        self.config = config
+
+        if self.config is None:
+            self.config = http_logging.ConfigLog()
+
+        # Handlers without a dispatcher would ship partitioned events of
+        # the default cache to their own destination
+        if self.config.database_path == constants.DATABASE_PATH:
+            self.config = dataclasses.replace(
+                self.config,
+                database_path=constants.DISPATCHER_DATABASE_PATH,
+            )
+
+        claim_cache_path(
+            owner=self,
+            path=self.config.database_path,
+            destination=f'{type(self).__name__}-{id(self):x}',
+        )
+
+        self._lock = threading.Lock()
+        self._transports = {}
+        self._handlers = set()
+        self._memory_cache = {}
+        self._session = None
+        self._worker = None
+
+    def streams(self) -> List[str]:
+        # called from the worker: registering replaces the dict
+        return list(self._transports)
+
+    def get_transport(self, stream: str) -> Optional[AsyncHttpTransport]:
+        return self._transports.get(stream)
+
+    def add_stream(self, transport: AsyncHttpTransport) -> str:
+        '''Ship the events of `transport`'s destination, including those
+        left in the cache by a previous run, returns its stream'''
+        with self._lock:
+            return self._add_stream(transport)
+
+    def register(
+        self,
+        handler: logging.Handler,
+        transport: AsyncHttpTransport,
+    ) -> Tuple[str, DispatchingWorker]:
+        '''Register a handler shipping through `transport`, returns its
+        stream and the running shared worker'''
+        with self._lock:
+            stream = self._add_stream(transport)
+            self._handlers.add(handler)
+            self._share_session()
+
+            return stream, self._start_worker()
+
+    def _add_stream(self, transport: AsyncHttpTransport) -> str:
+        stream = stream_key(transport)
+
+        if stream not in self._transports:
+            self._transports = {**self._transports, stream: transport}
+
+            if self._session is not None:
+                self._share_session()
+
+        return stream
+
+    def _share_session(self) -> None:
+        session = self._get_session()
+
+        for transport in self._transports.values():
+            if isinstance(transport, AsyncHttpTransport):
+                transport.shared_session = session
+
+    def unregister(
+        self,
+        handler: logging.Handler,
+        flush: bool = True,
+        timeout: Optional[float] = None,
+    ) -> None:
+        '''Stop the worker once the last handler is unregistered, waiting
+        up to `timeout` seconds for it to ship (if `flush`) and exit'''
+        with self._lock:
+            self._handlers.discard(handler)
+
+            if self._worker is None:
+                return
+
+            if self._handlers:
+                if flush:
+                    self._worker.force_flush_queued_events()
+                return
+
+            worker, self._worker = self._worker, None
+            worker.shutdown(flush=flush)
+
+        # Not under the lock: the final flush may wait for an unresponsive
+        # collector while other handlers are created or log again
+        worker.join(timeout=timeout)
+
+        with self._lock:
+            # Kept for the worker started meanwhile, if any
+            if self._worker is None and not worker.is_alive():
+                self._close_session()
+
+    def _start_worker(self) -> DispatchingWorker:
+        if self._worker is not None and self._worker.is_alive():
+            return self._worker
+
+        self._worker = DispatchingWorker(
+            host=None,
+            port=None,
+            transport=None,
+            ssl_enable=self.config.security.ssl_enable,
+            ssl_verify=self.config.security.ssl_verify,
+            keyfile=self.config.security.keyfile,
+            certfile=self.config.security.certfile,
+            ca_certs=self.config.security.ca_certs,
+            database_path=self.config.database_path,
+            cache=self._memory_cache,
+            event_ttl=self.config.event_ttl,
+            config=self.config,
+            dispatcher=self,
+        )
+        self._worker.start()
+
+        return self._worker
+
+    def _get_session(self):
+        if self._session is not None:
+            return self._session
+
+        if self.config.http2:
+            try:
+                self._session = Http2Session(
+                    ssl_verify=self.config.security.ssl_verify,
+                    certfile=self.config.security.certfile,
+                    keyfile=self.config.security.keyfile,
+                    max_streams=self.config.http2_max_streams,
+                )
+                return self._session
+            except ImportError as exc:
+                logger.warning(
+                    'HTTP/2 unavailable, falling back to HTTP/1.1: %s', exc)
+
+        # One pool per collector, sized for concurrent drains
+        adapter = HTTPAdapter(pool_maxsize=self.config.drain_concurrency)
+
+        self._session = requests.Session()
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+        return self._session
+
+    def _close_session(self) -> None:
+        session, self._session = self._session, None
+
+        # Streams stay registered: handlers created but not closed yet may
+        # start logging again
+        for transport in self._transports.values():
+            if isinstance(transport, AsyncHttpTransport):
+                transport.shared_session = None
+
+        if isinstance(session, Http2Session):
+            session.shutdown()
+        elif session is not None:
+            session.close()
+
+
+def stream_key(transport) -> str:
+    '''Destination URL of a transport, or its identity if it has none'''
+    url = getattr(transport, 'url', None)
+
+    if isinstance(url, str):
+        return url
+
+    return f'{type(transport).__name__}-{id(transport):x}'
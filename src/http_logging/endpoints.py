@@ -0,0 +1,74 @@
+import itertools
+import threading
+import time
+from typing import List
+
+import http_logging
+import http_logging.constants as constants
+
+
+# Weight of the latest sample in the moving average of an endpoint latency
+LATENCY_SMOOTHING = 0.3
+
+
+class Endpoint:
+    '''Health and latency tracking for one host of an `HttpHostGroup`'''
+
+    def __init__(self, host: http_logging.HttpHost, url: str) -> None:
+        self.host = host
+        self.url = url
+        self.latency = 0.0  # Unknown latency: probe it first
+        self.failures = 0
+        self.ejected_until = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return self.ejected_until <= time.monotonic()
+
+
+class EndpointPool:
+    '''Orders the endpoints of an `HttpHostGroup` for each batch'''
+
+    def __init__(
+        self,
+        group: http_logging.HttpHostGroup,
+        endpoints: List[Endpoint],
+    ) -> None:
+        self.group = group
+        self.endpoints = endpoints
+
+        self._lock = threading.Lock()
+        self._round_robin = itertools.cycle(range(len(endpoints)))
+
+    def candidates(self) -> List[Endpoint]:
+        '''Endpoints to try in order: healthy ones first, ordered by the
+        group strategy, then ejected ones soonest to recover first'''
+        with self._lock:
+            healthy = [e for e in self.endpoints if e.healthy]
+            ejected = [e for e in self.endpoints if not e.healthy]
+
+            if self.group.strategy == constants.ROUND_ROBIN and healthy:
+                start = next(self._round_robin) % len(healthy)
+                healthy = healthy[start:] + healthy[:start]
+
+            elif self.group.strategy == constants.LEAST_LATENCY:
+                healthy.sort(key=lambda e: e.latency)
+
+        return healthy + sorted(ejected, key=lambda e: e.ejected_until)
+
+    def report_success(self, endpoint: Endpoint, latency: float) -> None:
+        with self._lock:
+            endpoint.failures = 0
+            endpoint.ejected_until = 0.0
+            endpoint.latency = latency if endpoint.latency == 0.0 else (
+                LATENCY_SMOOTHING * latency +
+                (1 - LATENCY_SMOOTHING) * endpoint.latency
+            )
+
+    def report_failure(self, endpoint: Endpoint) -> None:
+        with self._lock:
+            endpoint.failures += 1
+
+            if endpoint.failures >= self.group.max_failures:
+                endpoint.ejected_until = \
+                    time.monotonic() + self.group.ejection_time
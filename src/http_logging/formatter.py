@@ -1,9 +1,145 @@
+import builtins
+from collections import OrderedDict
 import copy
 import logging
-from typing import Callable, Optional, Union
+import threading
+import traceback
+from types import TracebackType
+from typing import Callable, List, Optional, Tuple, Union
 
 from logstash_async.formatter import LogstashFormatter
 
+from http_logging.context import get_log_context
+from http_logging.secondary_classes import HttpLogSchema
+
+
+# Printed by `traceback` before an exception of a chain
+CAUSE_MESSAGE = '\nThe above exception was the direct cause of the ' \
+    'following exception:\n\n'
+CONTEXT_MESSAGE = '\nDuring handling of the above exception, another ' \
+    'exception occurred:\n\n'
+
+# Python 3.11+, groups render their nested exceptions
+EXCEPTION_GROUP_TYPES = tuple(
+    getattr(builtins, name)
+    for name in ('BaseExceptionGroup',)
+    if hasattr(builtins, name)
+)
+
+# An exception of a chain, its traceback and the message printed before it
+ChainLink = Tuple[BaseException, Optional[TracebackType], Optional[str]]
+
+
+class TracebackCache:
+    '''Bounded LRU cache of rendered tracebacks.
+
+    Entries are keyed on the type and frames (code object, line and
+    instruction) of an exception and of those chained to it, and hold the
+    rendered stacks only: exception messages are rendered on every call.
+    '''
+
+    def __init__(self, maxsize: int = 256) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def format(self, exc_info: tuple) -> str:
+        '''Same output as `traceback.format_exception(*exc_info)`'''
+        chain = exception_chain(exc_info[1], exc_info[2])
+
+        if any(isinstance(exc, EXCEPTION_GROUP_TYPES) for exc, _, _ in chain):
+            return ''.join(traceback.format_exception(*exc_info))
+
+        key = tuple(
+            (type(exc), link, frames_key(tb)) for exc, tb, link in chain)
+
+        with self._lock:
+            stacks = self._entries.get(key)
+
+            if stacks is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+
+        if stacks is None:
+            stacks = [format_stack(tb) for _, tb, _ in chain]
+
+            with self._lock:
+                self._entries[key] = stacks
+
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+
+        lines = []
+
+        for (exc, _, link), stack in zip(chain, stacks):
+            if link is not None:
+                lines.append(link)
+
+            lines.append(stack)
+            lines.extend(traceback.format_exception_only(type(exc), exc))
+
+        return ''.join(lines)
+
+
+def exception_chain(
+    exc: BaseException,
+    tb: Optional[TracebackType],
+) -> List[ChainLink]:
+    '''Exceptions chained to `exc` and `exc` itself, oldest first, as
+    printed by `traceback`'''
+    chain = []
+    seen = set()
+
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+
+        if exc.__cause__ is not None:
+            link, previous = CAUSE_MESSAGE, exc.__cause__
+        elif exc.__context__ is not None and not exc.__suppress_context__:
+            link, previous = CONTEXT_MESSAGE, exc.__context__
+        else:
+            link, previous = None, None
+
+        if previous is not None and id(previous) in seen:
+            link = None  # Cycle: the chain stops here
+
+        chain.append((exc, tb, link))
+
+        exc = previous
+        tb = previous.__traceback__ if previous is not None else None
+
+    chain.reverse()
+
+    return chain
+
+
+def frames_key(tb: Optional[TracebackType]) -> tuple:
+    frames = []
+
+    while tb is not None:
+        code = tb.tb_frame.f_code
+        # Code objects compare equal across files if their content does
+        frames.append((code, code.co_filename, tb.tb_lineno, tb.tb_lasti))
+        tb = tb.tb_next
+
+    return tuple(frames)
+
+
+def format_stack(tb: Optional[TracebackType]) -> str:
+    if tb is None:
+        return ''
+
+    return 'Traceback (most recent call last):\n' + \
+        ''.join(traceback.format_tb(tb))
+
 
 class HttpLogFormatter(LogstashFormatter):
 
@@ -18,6 +154,11 @@ class HttpLogFormatter(LogstashFormatter):
         extra: Optional[dict] = None,
         ensure_ascii: bool = True,
         metadata: Optional[dict] = None,
+        schema: Optional[HttpLogSchema] = None,
+        structured_message: bool = False,
+        render_message: bool = True,
+        context_field: Optional[str] = 'context',
+        traceback_cache_size: Optional[int] = 256,
     ) -> None:
         super().__init__(
             message_type=message_type,
@@ -30,8 +171,18 @@ class HttpLogFormatter(LogstashFormatter):
         )
 
         self._extension = extension
+        self._schema = schema
+        self._structured_message = structured_message
+        self._render_message = render_message
+        self._context_field = context_field
         self._default_log_record_keys = None
 
+        # Exceptions raised over and over from the same place are rendered
+        # once
+        self.traceback_cache = None
+        if traceback_cache_size:
+            self.traceback_cache = TracebackCache(maxsize=traceback_cache_size)
+
     @property
     def default_log_record_keys(self):
         '''Extract __dict__.keys from a dummy LogRecord object'''
@@ -51,16 +202,25 @@ class HttpLogFormatter(LogstashFormatter):
         return self._default_log_record_keys
 
     def build_log_message(self, record: logging.LogRecord):
-        return {
+        message = {
             'type': self._message_type,
             'created': record.created,
             'relative_created': record.relativeCreated,
-            'message': record.getMessage(),
+        }
+
+        if self._render_message and self._is_field_enabled('message'):
+            message['message'] = record.getMessage()
+
+        if self._structured_message:
+            message.update(self.build_structured_message(record=record))
+
+        message.update({
             'level': {
                 'number': record.levelno,
                 'name': record.levelname,
             },
-            'stack_trace': self._format_exception(record.exc_info),
+            'stack_trace': self._format_exception(record.exc_info)
+            if self._is_field_enabled('stack_trace') else None,
             'source_code': {
                 'pathname': record.pathname,
                 'function': record.funcName,
@@ -74,14 +234,58 @@ class HttpLogFormatter(LogstashFormatter):
                 'id': record.thread,
                 'name': record.threadName,
             },
+        })
+
+        return message
+
+    def build_structured_message(self, record: logging.LogRecord) -> dict:
+        '''Template and arguments of the message, without interpolating them,
+        so the collector can group events by template and render them'''
+        args = record.args
+
+        if not args:
+            args = []
+        elif isinstance(args, tuple):
+            args = [self._value_repr(arg) for arg in args]
+        else:  # Single mapping, e.g. `logger.info('%(x)s', {'x': 1})`
+            args = self._value_repr(args)
+
+        return {
+            'msg_template': str(record.msg),
+            'args': args,
         }
 
     def format(self, record: logging.LogRecord):
         message = self.build_log_message(record=record)
 
-        message = self._get_extra_fields(message, record)
+        if self._is_field_enabled(self._extra_prefix):
+            message = self._get_extra_fields(message, record)
+
+        if self._schema is not None:
+            message = self._apply_schema(message)
+
+        return self._splice_context(self._serialize(message))
+
+    def _format_exception(self, exc_info) -> str:
+        if self.traceback_cache is None or not isinstance(exc_info, tuple) \
+                or exc_info[1] is None:
+            return super()._format_exception(exc_info)
+
+        return self.traceback_cache.format(exc_info)
 
-        return self._serialize(message)
+    def _splice_context(self, serialized: str) -> str:
+        '''Insert the context bound with `http_logging.bind_context`, already
+        encoded, as the last field of a serialized event'''
+        encoded = get_log_context().encoded
+
+        if encoded is None or self._context_field is None or \
+                not self._is_field_enabled(self._context_field):
+            return serialized
+
+        separator = ', ' if serialized != '{}' else ''
+
+        return f'{serialized[:-1]}{separator}"{self._context_field}": ' \
+            f'{encoded}}}'
 
     def _get_extra_fields(
         self,
@@ -100,3 +304,101 @@ class HttpLogFormatter(LogstashFormatter):
             message[self._extra_prefix] = extra
 
         return message
+
+    def _is_field_enabled(self, field_name: str) -> bool:
+        return self._schema is None or \
+            self._schema.is_field_enabled(field_name)
+
+    def _apply_schema(self, message: dict) -> dict:
+        schema = self._schema
+
+        message = {
+            key: value
+            for key, value in message.items()
+            if schema.is_field_enabled(key)
+        }
+
+        if 'message' in message and schema.max_message_length is not None:
+            message['message'] = self._truncate(
+                message['message'], schema.max_message_length)
+
+        if 'stack_trace' in message and \
+                schema.max_stack_trace_length is not None:
+            message['stack_trace'] = self._truncate(
+                message['stack_trace'], schema.max_stack_trace_length)
+
+        if self._extra_prefix in message and (
+                schema.max_extra_depth is not None or
+                schema.max_extra_size is not None):
+            message[self._extra_prefix] = self._limit_value(
+                message[self._extra_prefix],
+                depth=0,
+                budget=[schema.max_extra_size],
+            )
+
+        return message
+
+    def _truncate(self, text, max_length: int):
+        if not isinstance(text, str) or len(text) <= max_length:
+            return text
+
+        marker = self._schema.truncation_marker
+
+        if max_length <= len(marker):
+            return text[:max_length]
+
+        return text[:max_length - len(marker)] + marker
+
+    def _limit_value(self, value, depth: int, budget: list):
+        '''Copy of an `extra` value bounded in depth and total size.
+
+        `budget` holds the characters left (`None` for no size cap) and is
+        shared along the walk, so nothing is visited once it runs out.
+        '''
+        marker = self._schema.truncation_marker
+        max_depth = self._schema.max_extra_depth
+
+        if not isinstance(value, (dict, list, tuple, set)):
+            return self._limit_scalar(value, budget)
+
+        if max_depth is not None and depth >= max_depth:
+            return marker
+
+        is_dict = isinstance(value, dict)
+        items = value.items() if is_dict else enumerate(value)
+        limited = {} if is_dict else []
+
+        for key, item in items:
+            if budget[0] is not None and budget[0] <= 0:
+                if is_dict:
+                    limited[marker] = marker
+                else:
+                    limited.append(marker)
+                break
+
+            item = self._limit_value(item, depth + 1, budget)
+
+            if is_dict:
+                limited[str(key)] = item
+            else:
+                limited.append(item)
+
+        return limited
+
+    def _limit_scalar(self, value, budget: list):
+        value = self._value_repr(value)
+
+        if budget[0] is None:
+            return value
+
+        size = len(value) if isinstance(value, str) else len(str(value))
+
+        if size > budget[0]:
+            value = self._truncate(
+                str(value),
+                max(budget[0], len(self._schema.truncation_marker)),
+            )
+
+        budget[0] -= size
+
+        return value
@@ -0,0 +1,111 @@
+from collections import deque
+import contextvars
+import heapq
+import itertools
+import logging
+import threading
+from typing import Callable, List, Tuple
+
+
+# A record and the context it was emitted in
+Entry = Tuple[logging.LogRecord, contextvars.Context]
+
+
+class ShardedRecordBuffer:
+    '''Records appended without locking, in one of several shards.
+
+    Each producer thread is assigned a shard on its first append. Appending
+    to a `deque` is atomic, so producers never wait for each other or for
+    the consumer, whatever their number.
+    '''
+
+    def __init__(self, shards: int) -> None:
+        if shards < 1:
+            raise ValueError('ShardedRecordBuffer requires at least one shard')
+
+        self.shards = [deque() for _ in range(shards)]
+
+        self._local = threading.local()
+        self._next_shard = itertools.count()
+
+    def append(self, record: logging.LogRecord) -> None:
+        shard = getattr(self._local, 'shard', None)
+
+        if shard is None:
+            shard = self.shards[next(self._next_shard) % len(self.shards)]
+            self._local.shard = shard
+
+        # The context is captured here, as records are formatted later, in
+        # another thread
+        shard.append((record, contextvars.copy_context()))
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self.shards)
+
+    def pop_all(self) -> List[Entry]:
+        '''Remove every buffered record, merged in creation order'''
+        batches = []
+
+        for shard in self.shards:
+            batch = []
+
+            # Unlike iterating or copying, popping is safe while producers
+            # append to the other end of the shard
+            for _ in range(len(shard)):
+                batch.append(shard.popleft())
+
+            if batch:
+                batches.append(batch)
+
+        if len(batches) == 1:
+            return batches[0]
+
+        return list(heapq.merge(*batches, key=lambda e: e[0].created))
+
+
+class RecordConsumer(threading.Thread):
+    '''Single thread moving records from a `ShardedRecordBuffer` to
+    `dispatch`, which formats and enqueues them for the worker'''
+
+    def __init__(
+        self,
+        buffer: ShardedRecordBuffer,
+        dispatch: Callable[[logging.LogRecord], None],
+        poll_interval: float,
+    ) -> None:
+        super().__init__(name='http-logging-consumer', daemon=True)
+
+        self.buffer = buffer
+        self.dispatch = dispatch
+        self.poll_interval = poll_interval
+
+        self._wakeup_event = threading.Event()
+        self._shutdown_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def wakeup(self) -> None:
+        # called from producer threads: only the first one after the
+        # consumer went idle pays for setting the event
+        if not self._wakeup_event.is_set():
+            self._wakeup_event.set()
+
+    def run(self) -> None:
+        while not self._shutdown_event.is_set():
+            self._wakeup_event.wait(self.poll_interval)
+            self._wakeup_event.clear()
+            self.drain()
+
+        self.drain()
+
+    def drain(self) -> None:
+        '''Dispatch every buffered record, from any thread'''
+        with self._lock:
+            for record, context in self.buffer.pop_all():
+                context.run(self.dispatch, record)
+
+    def shutdown(self, timeout: float = None) -> None:
+        self._shutdown_event.set()
+        self._wakeup_event.set()
+
+        if self.is_alive():
+            self.join(timeout=timeout)
@@ -1,11 +1,26 @@
 import logging
-from typing import Optional
+import threading
+from typing import List, Optional
 
 from logstash_async.handler import AsynchronousLogstashHandler
 from logstash_async.transport import Transport
 
 import http_logging
+from http_logging.cache import claim_cache_path, release_cache_path
+from http_logging.dispatcher import HttpDispatcher, stream_key
+from http_logging.frontend import RecordConsumer, ShardedRecordBuffer
+from http_logging.rollup import (
+    ROLLUP_SHUTDOWN_TIMEOUT,
+    RollupAggregator,
+    RollupFlusher,
+)
 from http_logging.secondary_classes import HttpHost
+from http_logging.worker import AsyncHttpWorker
+
+
+# Extra time granted to the worker to persist what could not be shipped
+# within a drain deadline and report it
+DRAIN_REPORT_TIMEOUT = 0.5
 
 
 class AsyncHttpHandler(AsynchronousLogstashHandler):
@@ -18,6 +33,7 @@ class AsyncHttpHandler(AsynchronousLogstashHandler):
         transport_class: Optional[Transport] = None,
         formatter_class: Optional[logging.Formatter] = None,
         config: Optional[http_logging.ConfigLog] = None,
+        dispatcher: Optional[HttpDispatcher] = None,
         **kwargs,
     ):
         if not http_host:
@@ -27,6 +43,15 @@ class AsyncHttpHandler(AsynchronousLogstashHandler):
         self.support_class = support_class
         self.config = config
 
+        # Each handler runs its own worker, tuned by its own ConfigLog,
+        # unless it shares the worker of a dispatcher
+        self.dispatcher = dispatcher
+        self._stream = None
+        self._worker_thread = None
+        self._worker_join_timeout = None
+        self._flush_on_shutdown = True
+        self._memory_cache = {}
+
         # Register this Handler as the HttpHost parent
         self.http_host.register_parent_handler(handler=self)
 
@@ -38,7 +63,7 @@ class AsyncHttpHandler(AsynchronousLogstashHandler):
         if self.support_class is None:
             self.support_class = http_logging.SupportClass(
                 http_host=http_host,
-                config=config,
+                config=self.config,
                 _transport=transport_class,
                 _formatter=formatter_class,
             )
@@ -60,3 +85,254 @@ class AsyncHttpHandler(AsynchronousLogstashHandler):
         )
 
         self.formatter = self.support_class.formatter
+
+        # Lock-free front end: records are formatted by a consumer thread
+        self._record_buffer = None
+        self._record_consumer = None
+        self._consumer_lock = threading.Lock()
+
+        if self.config.frontend_shards is not None:
+            self._record_buffer = ShardedRecordBuffer(
+                shards=self.config.frontend_shards)
+
+        # Log-to-metrics: matching records are folded into rollup events
+        self._rollups = None
+        self._rollup_flusher = None
+        self._rollup_lock = threading.Lock()
+
+        self._setup_lock = threading.Lock()
+
+        if self.dispatcher is not None:
+            self._setup_transport()
+            self.dispatcher.add_stream(self._transport)
+        else:
+            claim_cache_path(
+                owner=self,
+                path=self._database_path,
+                destination=stream_key(self._transport_path),
+            )
+
+        if self.config.rollups:
+            self._rollups = RollupAggregator(rollups=self.config.rollups)
+
+    def handle(self, record: logging.LogRecord):
+        if self._record_buffer is None:
+            return super().handle(record)
+
+        # Same as `logging.Handler.handle`, without the handler lock
+        rv = self.filter(record)
+        if isinstance(rv, logging.LogRecord):
+            record = rv
+        if rv:
+            self.emit(record)
+        return rv
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if not self._enable:
+            return
+
+        if self._record_buffer is None:
+            self._dispatch(record)
+            return
+
+        consumer = self._start_record_consumer()
+        self._record_buffer.append(record)
+        consumer.wakeup()
+
+    def _dispatch(self, record: logging.LogRecord) -> None:
+        '''Format a record and enqueue it for the worker'''
+        if self._rollups is not None and self._rollups.add(record):
+            self._start_rollup_flusher()
+            return
+
+        if not self._worker_thread_is_running():
+            # Records may come from the record consumer or the rollup
+            # flusher, concurrently with the logging threads
+            with self._setup_lock:
+                self._setup_transport()
+                self._start_worker_thread()
+
+        try:
+            data = self._format_record(record)
+
+            if self._stream is not None:
+                data = (self._stream, data)
+
+            if self._is_priority_record(record):
+                self._worker_thread.enqueue_priority_event(data)
+            else:
+                self._worker_thread.enqueue_event(data)
+        except Exception:
+            self.handleError(record)
+
+    def _start_record_consumer(self) -> RecordConsumer:
+        consumer = self._record_consumer
+        if consumer is not None:
+            return consumer
+
+        with self._consumer_lock:
+            if self._record_consumer is None:
+                consumer = RecordConsumer(
+                    buffer=self._record_buffer,
+                    dispatch=self._dispatch,
+                    poll_interval=self.config.frontend_poll_interval,
+                )
+                consumer.start()
+                self._record_consumer = consumer
+
+            return self._record_consumer
+
+    def _stop_record_consumer(self) -> None:
+        with self._consumer_lock:
+            consumer, self._record_consumer = self._record_consumer, None
+
+        if consumer is not None:
+            consumer.shutdown()
+
+    def _start_rollup_flusher(self) -> None:
+        if self._rollup_flusher is not None:
+            return
+
+        with self._rollup_lock:
+            if self._rollup_flusher is None:
+                self._rollup_flusher = RollupFlusher(
+                    aggregator=self._rollups,
+                    ship=self._ship_rollups,
+                )
+                self._rollup_flusher.start()
+
+    def _stop_rollup_flusher(self) -> None:
+        with self._rollup_lock:
+            flusher, self._rollup_flusher = self._rollup_flusher, None
+
+        if flusher is not None:
+            flusher.shutdown(timeout=ROLLUP_SHUTDOWN_TIMEOUT)
+
+        # Partial windows are shipped as well
+        self._ship_rollups(self._rollups.collect(force=True))
+
+    def _ship_rollups(self, records: List[logging.LogRecord]) -> None:
+        # Not under the handler lock: `logging.shutdown` holds it while
+        # closing the handler, which waits for the flusher
+        for record in records:
+            self.emit(record)
+
+    def _is_priority_record(self, record: logging.LogRecord) -> bool:
+        priority_level = self.config.priority_level
+
+        return priority_level is not None and record.levelno >= priority_level
+
+    def flush(
+        self,
+        timeout: Optional[float] = None,
+    ) -> Optional[http_logging.FlushResult]:
+        '''Without a timeout, trigger a flush on the worker and return
+
+        With a timeout, block until buffered events are shipped (concurrently)
+        or the deadline is reached, and report how many events were shipped
+        and how many were deferred to the cache.
+        '''
+        if self._record_consumer is not None:
+            self._record_consumer.drain()
+
+        if not self._worker_thread_is_running():
+            return None if timeout is None else http_logging.FlushResult()
+
+        if timeout is None:
+            self._worker_thread.force_flush_queued_events()
+            return None
+
+        request = self._worker_thread.request_drain(timeout=timeout)
+
+        if request.wait(timeout + DRAIN_REPORT_TIMEOUT):
+            return request.result
+
+        # Worker is busy (e.g. blocked on an unresponsive collector)
+        return http_logging.FlushResult(
+            shipped=request.shipped,
+            deferred=self._worker_thread.pending_event_count,
+        )
+
+    def close(
+        self,
+        drain_timeout: Optional[float] = None,
+    ) -> Optional[http_logging.FlushResult]:
+        '''Close the handler, draining buffered events within `drain_timeout`
+        seconds (defaults to `ConfigLog.drain_timeout`). Events that could not
+        be shipped in time stay in the cache for the next start.
+        '''
+        if drain_timeout is None:
+            drain_timeout = self.config.drain_timeout
+
+        if self._rollups is not None:
+            self._stop_rollup_flusher()
+
+        self._stop_record_consumer()
+
+        result = None
+
+        if drain_timeout is not None and self._worker_thread_is_running():
+            result = self.flush(timeout=drain_timeout)
+
+            # Do not retry what the drain could not ship while shutting down
+            self._flush_on_shutdown = False
+            self._worker_join_timeout = DRAIN_REPORT_TIMEOUT
+
+        try:
+            super().close()
+        finally:
+            self._flush_on_shutdown = True
+            self._worker_join_timeout = None
+            release_cache_path(self)
+
+        return result
+
+    def _start_worker_thread(self) -> None:
+        if self._worker_thread_is_running():
+            return
+
+        if self.dispatcher is not None:
+            self._stream, self._worker_thread = self.dispatcher.register(
+                handler=self, transport=self._transport)
+            return
+
+        self._worker_thread = AsyncHttpWorker(
+            host=self._host,
+            port=self._port,
+            transport=self._transport,
+            ssl_enable=self._ssl_enable,
+            ssl_verify=self._ssl_verify,
+            ssl_verify_flags=getattr(self, '_ssl_verify_flags', None),
+            keyfile=self._keyfile,
+            certfile=self._certfile,
+            ca_certs=self._ca_certs,
+            database_path=self._database_path,
+            cache=self._memory_cache,
+            event_ttl=self._event_ttl,
+            config=self.config,
+        )
+        self._worker_thread.start()
+
+    def _worker_thread_is_running(self) -> bool:
+        return self._worker_thread is not None and \
+            self._worker_thread.is_alive()
+
+    def _trigger_worker_shutdown(self) -> None:
+        if self.dispatcher is None:
+            self._worker_thread.shutdown(flush=self._flush_on_shutdown)
+            return
+
+        # The shared worker only stops with the last handler
+        self.dispatcher.unregister(
+            handler=self,
+            flush=self._flush_on_shutdown,
+            timeout=self._worker_join_timeout,
+        )
+
+    def _wait_for_worker_thread(self) -> None:
+        if self.dispatcher is None:
+            self._worker_thread.join(timeout=self._worker_join_timeout)
+
+    def _reset_worker_thread(self) -> None:
+        self._worker_thread = None
+        self._stream = None
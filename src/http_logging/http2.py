@@ -0,0 +1,100 @@
+import threading
+from typing import TYPE_CHECKING, Optional
+
+import requests
+
+
+if TYPE_CHECKING:  # pragma: no cover
+    import httpx
+
+
+class Http2Response:
+    '''Subset of `requests.Response` used by `AsyncHttpTransport`'''
+
+    def __init__(self, response: 'httpx.Response') -> None:
+        self.response = response
+
+    @property
+    def ok(self) -> bool:
+        return not self.response.is_error
+
+    @property
+    def status_code(self) -> int:
+        return self.response.status_code
+
+    @property
+    def http_version(self) -> str:
+        return self.response.http_version
+
+    def raise_for_status(self) -> None:
+        import httpx
+
+        # As `requests` would, so the worker logs a network error
+        try:
+            self.response.raise_for_status()
+        except httpx.HTTPStatusError as exc:
+            raise requests.exceptions.HTTPError(
+                str(exc), response=self) from exc
+
+
+class Http2Session:
+    '''`requests.Session` look-alike multiplexing requests over HTTP/2.
+
+    Batches sent concurrently share one connection per collector, with at
+    most `max_streams` requests in flight. Collectors that do not negotiate
+    HTTP/2 are served over HTTP/1.1 by the same client.
+    '''
+
+    def __init__(
+        self,
+        ssl_verify: bool = True,
+        certfile: Optional[str] = None,
+        keyfile: Optional[str] = None,
+        max_streams: int = 100,
+    ) -> None:
+        # Optional dependency: pip install http_logging[http2]
+        import httpx
+
+        client_args = {'http2': True, 'verify': ssl_verify}
+        if certfile:
+            client_args['cert'] = (certfile, keyfile) if keyfile else certfile
+
+        # Raises ImportError as well if the `h2` package is missing
+        self._client = httpx.Client(**client_args)
+        self._streams = threading.BoundedSemaphore(max_streams)
+
+    def post(
+        self,
+        url: str,
+        headers: dict,
+        json=None,
+        data: Optional[bytes] = None,
+        verify=None,
+        timeout=None,
+    ):
+        import httpx
+
+        # `verify` is set for the whole client, as connections are shared
+        with self._streams:
+            try:
+                response = self._client.post(
+                    url,
+                    headers=headers,
+                    json=json,
+                    content=data,
+                    timeout=timeout,
+                )
+            # Raised as their `requests` equivalents, handled as network
+            # errors by the worker
+            except httpx.TimeoutException as exc:
+                raise requests.exceptions.Timeout(str(exc)) from exc
+            except httpx.TransportError as exc:
+                raise requests.exceptions.ConnectionError(str(exc)) from exc
+
+        return Http2Response(response)
+
+    def close(self) -> None:
+        pass  # Connections are kept across batches until `shutdown`
+
+    def shutdown(self) -> None:
+        self._client.close()
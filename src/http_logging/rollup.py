@@ -0,0 +1,170 @@
+import bisect
+import logging
+import math
+import threading
+import time
+from typing import Callable, List, Optional
+
+from http_logging.secondary_classes import HttpRollup
+
+
+# Seconds between checks for rollup windows to ship
+ROLLUP_CHECK_INTERVAL = 1.0
+
+# Seconds to wait on close for the flusher to finish shipping
+ROLLUP_SHUTDOWN_TIMEOUT = 5.0
+
+
+class RollupRecord(logging.LogRecord):
+    '''Record carrying a rollup event, never folded itself'''
+
+
+class RollupWindow:
+    '''Count, sum, extremes and histogram of the values of a time window'''
+
+    def __init__(self, rollup: HttpRollup, start: float) -> None:
+        self.rollup = rollup
+        self.start = start
+        self.end = start + rollup.window
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        # One count per bucket, plus values above the last bound
+        self.bucket_counts = [0] * (len(rollup.buckets) + 1)
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.bucket_counts[bisect.bisect_left(self.rollup.buckets, value)] += 1
+
+    def build_record(self) -> RollupRecord:
+        rollup = self.rollup
+
+        record = RollupRecord(
+            name=rollup.logger or 'http-logging.rollup',
+            level=rollup.level or logging.INFO,
+            pathname=__file__,
+            lineno=0,
+            msg='Rollup %s: %d events',
+            args=(rollup.name, self.count),
+            exc_info=None,
+        )
+        record.rollup = {
+            'name': rollup.name,
+            'field': rollup.value_field,
+            'msg_template': rollup.msg_template,
+            'window_start': self.start,
+            'window_end': self.end,
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.sum / self.count,
+            'histogram': {
+                'buckets': list(rollup.buckets),
+                'counts': self.bucket_counts,
+            },
+        }
+
+        return record
+
+
+class RollupAggregator:
+    '''Folds records matching `HttpRollup` rules into time windows.
+
+    Windows are aligned on multiples of their duration, by record creation
+    time. Once over, each non-empty window becomes a single `RollupRecord`.
+    '''
+
+    def __init__(self, rollups: List[HttpRollup]) -> None:
+        self.rollups = list(rollups)
+
+        self._windows = {}
+        self._closed = []
+        self._lock = threading.Lock()
+
+    def add(self, record: logging.LogRecord) -> bool:
+        '''Fold a record, returns False if it must be shipped as usual'''
+        if isinstance(record, RollupRecord):
+            return False
+
+        for index, rollup in enumerate(self.rollups):
+            if rollup.matches(record):
+                break
+        else:
+            return False
+
+        value = getattr(record, rollup.value_field, None)
+
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return False
+
+        start = record.created - record.created % rollup.window
+
+        with self._lock:
+            window = self._windows.get(index)
+
+            if window is None or start >= window.end:
+                if window is not None:
+                    self._closed.append(window)
+
+                window = RollupWindow(rollup=rollup, start=start)
+                self._windows[index] = window
+
+            # Late records are folded into the current window
+            window.add(value)
+
+        return True
+
+    def collect(
+        self,
+        force: bool = False,
+        now: Optional[float] = None,
+    ) -> List[RollupRecord]:
+        '''Records of the windows that are over, or of every window if
+        `force`'''
+        if now is None:
+            now = time.time()
+
+        with self._lock:
+            closed, self._closed = self._closed, []
+
+            for index, window in list(self._windows.items()):
+                if force or window.end <= now:
+                    closed.append(self._windows.pop(index))
+
+        return [window.build_record() for window in closed]
+
+
+class RollupFlusher(threading.Thread):
+    '''Ships the rollup windows that are over, as time passes'''
+
+    def __init__(
+        self,
+        aggregator: RollupAggregator,
+        ship: Callable[[List[RollupRecord]], None],
+        interval: float = ROLLUP_CHECK_INTERVAL,
+    ) -> None:
+        super().__init__(name='http-logging-rollup', daemon=True)
+
+        self.aggregator = aggregator
+        self.ship = ship
+        self.interval = interval
+
+        self._shutdown_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._shutdown_event.wait(self.interval):
+            records = self.aggregator.collect()
+
+            if records:
+                self.ship(records)
+
+    def shutdown(self, timeout: float = None) -> None:
+        self._shutdown_event.set()
+
+        if self.is_alive():
+            self.join(timeout=timeout)
@@ -1,12 +1,14 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import logging
-from typing import Callable, Optional
-
-from logstash_async.transport import Transport
+from typing import TYPE_CHECKING, Callable, List, Optional
 
 import http_logging.constants as constants
 
 
+if TYPE_CHECKING:  # pragma: no cover
+    from logstash_async.transport import Transport
+
+
 logger = logging.getLogger('http-logging')
 
 
@@ -35,6 +37,44 @@ class HttpHost:
         self._parentHandler = handler
 
 
+@dataclass
+class HttpHostGroup(HttpHost):
+    '''Several collector endpoints used as a single `HttpHost`
+
+    Strategies:
+    - `round_robin`: rotate batches across healthy hosts
+    - `least_latency`: prefer the host with the lowest average latency
+    - `failover`: active/passive, use hosts in the given order
+
+    A batch that fails on one host is retried on the next candidate. Hosts
+    failing `max_failures` times in a row are ejected for `ejection_time`
+    seconds. Batches shipped are also duplicated to `mirror`, if set.
+    '''
+    hosts: List[HttpHost] = field(default_factory=list)
+    strategy: str = constants.ROUND_ROBIN
+    mirror: Optional[HttpHost] = None
+    max_failures: int = 3
+    ejection_time: float = 30.0
+
+    def __post_init__(self) -> None:
+        if not self.hosts:
+            raise ValueError('HttpHostGroup requires at least one host')
+
+        if self.strategy not in constants.LOAD_BALANCING_STRATEGIES:
+            raise ValueError(
+                f'Invalid strategy {self.strategy!r}, expected one of: '
+                f'{", ".join(constants.LOAD_BALANCING_STRATEGIES)}'
+            )
+
+        # Describe the group by its primary host
+        primary = self.hosts[0]
+
+        if self.name is None:
+            self.name = primary.name
+            self.port = primary.port
+            self.path = primary.path
+
+
 @dataclass
 class HttpSecurity:
     ssl_enable: bool = True
@@ -44,6 +84,43 @@ class HttpSecurity:
     ca_certs: list = None
 
 
+@dataclass
+class HttpRollup:
+    '''Records folded into one rollup event per `window` seconds
+
+    Records match if they come from `logger` (or one of its children), at
+    `level` and with `msg_template` as message template, each criterion
+    being optional. The numeric `extra` attribute `value_field` is folded
+    into a count, sum, min, max and a histogram with `buckets` as upper
+    bounds. Matching records without a numeric value are shipped as usual.
+    '''
+    name: str
+    value_field: str
+    logger: Optional[str] = None
+    level: Optional[int] = None
+    msg_template: Optional[str] = None
+    window: float = 60.0
+    buckets: List[float] = field(
+        default_factory=lambda: list(constants.ROLLUP_BUCKETS))
+
+    def __post_init__(self) -> None:
+        if self.window <= 0:
+            raise ValueError('HttpRollup window must be positive')
+
+        if list(self.buckets) != sorted(self.buckets):
+            raise ValueError('HttpRollup buckets must be in ascending order')
+
+    def matches(self, record: logging.LogRecord) -> bool:
+        if self.logger is not None and record.name != self.logger and \
+                not record.name.startswith(f'{self.logger}.'):
+            return False
+
+        if self.level is not None and record.levelno != self.level:
+            return False
+
+        return self.msg_template is None or record.msg == self.msg_template
+
+
 @dataclass
 class ConfigLog:
     database_path: str = constants.DATABASE_PATH
@@ -51,15 +128,83 @@ class ConfigLog:
     use_logging: bool = False
     encoding: str = constants.ENCODING
     custom_headers: Callable = None
+    custom_headers_ttl: float = constants.CUSTOM_HEADERS_TTL
     enable: bool = True
-    security: HttpSecurity = HttpSecurity()
+    security: HttpSecurity = field(default_factory=HttpSecurity)
+    queue_check_interval: float = constants.QUEUE_CHECK_INTERVAL
+    queued_events_flush_interval: float = \
+        constants.QUEUED_EVENTS_FLUSH_INTERVAL
+    queued_events_flush_count: int = constants.QUEUED_EVENTS_FLUSH_COUNT
+    queued_events_batch_size: int = constants.QUEUED_EVENTS_BATCH_SIZE
+    database_timeout: float = constants.DATABASE_TIMEOUT
+    flush_max_delay: Optional[float] = None
+    flush_max_bytes: int = 64 * 1024
+    priority_level: Optional[int] = None
+    priority_flush_delay: float = 0.0
+    drain_timeout: Optional[float] = None
+    drain_concurrency: int = 4
+    backlog_threshold: Optional[int] = None
+    backlog_chunk_size: int = 1000
+    backlog_rate_limit: Optional[float] = None
+    maintenance_interval: Optional[float] = 3600.0
+    maintenance_chunk_size: int = 1000
+    frontend_shards: Optional[int] = None
+    frontend_poll_interval: float = 0.05
+    http2: bool = False
+    http2_max_streams: int = 100
+    max_request_size: Optional[int] = None
+    pipeline_buffers: Optional[int] = None
+    pipeline_workers: int = 4
+    rollups: Optional[List[HttpRollup]] = None
+
+
+@dataclass
+class HttpLogSchema:
+    '''Projection and size caps applied by `HttpLogFormatter`
+
+    `include_fields`/`exclude_fields` select top-level event fields (e.g.
+    `relative_created`, `source_code`, `process`, `thread`, `extra`). Text
+    over its maximum length, `extra` values nested deeper than
+    `max_extra_depth` and whatever exceeds `max_extra_size` characters are
+    replaced by `truncation_marker`.
+    '''
+    include_fields: Optional[List[str]] = None
+    exclude_fields: Optional[List[str]] = None
+    max_message_length: Optional[int] = None
+    max_stack_trace_length: Optional[int] = None
+    max_extra_depth: Optional[int] = None
+    max_extra_size: Optional[int] = None
+    truncation_marker: str = '...[truncated]'
+
+    def is_field_enabled(self, field_name: str) -> bool:
+        if self.include_fields is not None and \
+                field_name not in self.include_fields:
+            return False
+
+        return not self.exclude_fields or \
+            field_name not in self.exclude_fields
+
+
+@dataclass
+class FlushResult:
+    shipped: int = 0
+    deferred: int = 0
+
+
+@dataclass
+class MaintenanceReport:
+    '''Outcome of a cache maintenance run, sizes in bytes'''
+    expired: int = 0
+    reclaimed: int = 0
+    size: int = 0
+    duration: float = 0.0
 
 
 @dataclass
 class SupportClass:
     http_host: HttpHost
-    config: ConfigLog = ConfigLog()
-    _transport: Transport = None
+    config: ConfigLog = field(default_factory=ConfigLog)
+    _transport: 'Transport' = None
     _formatter: logging.Formatter = None
 
     @property
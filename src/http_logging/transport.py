@@ -1,16 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor
 import json
 import logging
-from typing import List, Optional
+import queue
+import threading
+import time
+import types
+from typing import Iterator, List, Optional, Union
 
 from logstash_async.transport import HttpTransport
 import requests
 
 import http_logging
-from http_logging.secondary_classes import HttpHost
+from http_logging.endpoints import Endpoint, EndpointPool
+from http_logging.http2 import Http2Session
+from http_logging.secondary_classes import HttpHost, HttpHostGroup
 
 
 logger = logging.getLogger('http-logging')
 
+# Put in the pipeline queue once every batch has been prepared
+END_OF_BATCHES = object()
+
+
+class EncodedBatch(bytes):
+    '''JSON body of a batch, encoded ahead of sending'''
+
+    def __new__(cls, body: bytes, length: int) -> 'EncodedBatch':
+        batch = super().__new__(cls, body)
+        batch.length = length  # Count of events
+        return batch
+
 
 class HttpTransportLogger():
 
@@ -53,6 +72,10 @@ class AsyncHttpTransport(HttpTransport):
         if self.config is None:
             self.config = http_logging.ConfigLog()
 
+        if self.config.max_request_size is not None:
+            kwargs.setdefault('max_content_length',
+                              self.config.max_request_size)
+
         super().__init__(
             host=self.http_host.name,
             port=self.http_host.port,
@@ -63,25 +86,105 @@ class AsyncHttpTransport(HttpTransport):
             **kwargs,
         )
 
-        self.__batches = super()._HttpTransport__batches
+        self.__batches = self.split_batches
 
         self._path = self.http_host.path
         self._custom_headers = self.config.custom_headers
 
+        # Request template: everything but the body is built once
+        self._url = self.build_url(self.http_host)
+        self._static_headers = {'Content-Type': 'application/json'}
+        self._headers = None
+        self._headers_expire_at = 0.0
+        self._transport_logger = None
+
+        # Set by `HttpDispatcher` to pool connections across transports
+        self.shared_session = None
+
+        self._http2_session = None
+        self._http2_unavailable = False
+        self._http2_lock = threading.Lock()
+
+        self._pipeline_executor = None
+        self._pipeline_lock = threading.Lock()
+
+        self._endpoints = None
+        self._mirror = None
+
+        if isinstance(self.http_host, HttpHostGroup):
+            self._endpoints = EndpointPool(
+                group=self.http_host,
+                endpoints=[
+                    Endpoint(host=host, url=self.build_url(host))
+                    for host in self.http_host.hosts
+                ],
+            )
+
+            if self.http_host.mirror is not None:
+                self._mirror = Endpoint(
+                    host=self.http_host.mirror,
+                    url=self.build_url(self.http_host.mirror),
+                )
+
     @property
     def url(self) -> str:
+        return self._url
+
+    def build_url(self, host: http_logging.HttpHost) -> str:
         protocol = 'https' if self._ssl_enable else 'http'
-        port = f':{self._port}' if type(self._port) is int else ''
-        path = f'/{self._path}' if type(self._path) is str else ''
+        port = f':{host.port}' if type(host.port) is int else ''
+        path = f'/{host.path}' if type(host.path) is str else ''
 
-        return f'{protocol}://{self._host}{port}{path}'
+        return f'{protocol}://{host.name}{port}{path}'
 
     @property
     def headers(self) -> dict:
-        return {
-            'Content-Type': 'application/json',
-            **self.get_custom_headers(),
-        }
+        '''Static headers merged with `custom_headers`, which are refreshed
+        once `ConfigLog.custom_headers_ttl` seconds have passed'''
+        now = time.monotonic()
+
+        if self._headers is None or now >= self._headers_expire_at:
+            self._headers = {
+                **self._static_headers,
+                **self.get_custom_headers(),
+            }
+            self._headers_expire_at = now + self.config.custom_headers_ttl
+
+        return self._headers
+
+    def split_batches(self, events: list) -> Iterator[List[dict]]:
+        '''Split events into batches within the max content length.
+
+        Same output as `logstash_async`'s HttpTransport, but each event is
+        measured once instead of re-encoding the whole batch for every event.
+        '''
+        batch = []
+        batch_size = 2  # Brackets
+
+        for event in events:
+            if len(event) > self._max_content_length:
+                self.logger.warning(
+                    'The event size <%s> is greater than the max content '
+                    'length <%s>. Skipping event.'
+                    % (len(event), self._max_content_length))
+                continue
+
+            obj = json.loads(event)
+            event_size = len(json.dumps(obj).encode('utf8'))
+            separator_size = 2 if batch else 0  # ', '
+
+            if batch and batch_size + separator_size + event_size > \
+                    self._max_content_length:
+                yield batch
+                batch = []
+                batch_size = 2
+                separator_size = 0
+
+            batch.append(obj)
+            batch_size += separator_size + event_size
+
+        if batch:
+            yield batch
 
     def get_custom_headers(self) -> dict:
         if not callable(self._custom_headers):
@@ -89,38 +192,262 @@ class AsyncHttpTransport(HttpTransport):
         return self._custom_headers()
 
     def send(self, events: list, **kwargs) -> None:
-        self.__session = requests.Session()
+        raise_errors = kwargs.get('raise_errors', False)
+
+        session = self.new_session()
+
+        if self.pipeline_enabled(events):
+            batches = self.iter_prepared_batches(events)
+        else:
+            batches = self.__batches(events)
+
+        try:
+            for batch in batches:
+                self.log_batch(batch=batch)
+                self.send_batch(
+                    batch=batch,
+                    session=session,
+                    raise_errors=raise_errors,
+                )
+        finally:
+            # Stop the pipeline if sending was interrupted
+            if isinstance(batches, types.GeneratorType):
+                batches.close()
+
+            if session is not self.shared_session:
+                session.close()
+
+    def pipeline_enabled(self, events: list) -> bool:
+        '''Pipeline sends of more than one batch, if configured'''
+        if not self.config.pipeline_buffers:
+            return False
+
+        return sum(len(event) for event in events) > self._max_content_length
+
+    def iter_prepared_batches(self, events: list) -> Iterator[EncodedBatch]:
+        '''Batches split and encoded in the pipeline pool, at most
+        `ConfigLog.pipeline_buffers` ahead of the batch being sent'''
+        buffers = queue.Queue(maxsize=self.config.pipeline_buffers)
+        stopped = threading.Event()
+
+        def put(item) -> bool:
+            while not stopped.is_set():
+                try:
+                    buffers.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def prepare() -> None:
+            try:
+                for batch in self.split_encoded_batches(events):
+                    if not put(batch):
+                        return
+            except Exception as exc:
+                put(exc)
+            else:
+                put(END_OF_BATCHES)
+
+        self.get_pipeline_executor().submit(prepare)
+
+        try:
+            while True:
+                item = buffers.get()
+
+                if item is END_OF_BATCHES:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+
+                yield item
+        finally:
+            # Unblock and stop the preparation if sending was interrupted
+            stopped.set()
 
-        for batch in self.__batches(events):
-            self.log_batch(batch=batch)
-            self.send_batch(batch=batch)
+            while not buffers.empty():
+                buffers.get_nowait()
 
-        self.__session.close()
+    def split_encoded_batches(self, events: list) -> Iterator[EncodedBatch]:
+        '''Same batches as `split_batches`, as JSON bodies built from each
+        event encoded once, instead of encoding every batch again'''
+        batch = []
+        batch_size = 2  # Brackets
+
+        for event in events:
+            if len(event) > self._max_content_length:
+                self.logger.warning(
+                    'The event size <%s> is greater than the max content '
+                    'length <%s>. Skipping event.'
+                    % (len(event), self._max_content_length))
+                continue
+
+            # Same encoding as `requests` applies to `json=` bodies
+            encoded = json.dumps(json.loads(event), allow_nan=False) \
+                .encode('utf-8')
+            separator_size = 2 if batch else 0  # ', '
+
+            if batch and batch_size + separator_size + len(encoded) > \
+                    self._max_content_length:
+                yield self.join_batch(batch)
+                batch = []
+                batch_size = 2
+                separator_size = 0
+
+            batch.append(encoded)
+            batch_size += separator_size + len(encoded)
+
+        if batch:
+            yield self.join_batch(batch)
+
+    def join_batch(self, encoded_events: List[bytes]) -> EncodedBatch:
+        body = b'[' + b', '.join(encoded_events) + b']'
+        return EncodedBatch(body, length=len(encoded_events))
+
+    def get_pipeline_executor(self) -> ThreadPoolExecutor:
+        with self._pipeline_lock:
+            if self._pipeline_executor is None:
+                self._pipeline_executor = ThreadPoolExecutor(
+                    max_workers=self.config.pipeline_workers,
+                    thread_name_prefix='http-logging-pipeline',
+                )
+
+            return self._pipeline_executor
+
+    def new_session(self):
+        '''The dispatcher or HTTP/2 shared session if any, or else a new
+        `requests.Session`, so concurrent sends stay independent'''
+        if self.shared_session is not None:
+            return self.shared_session
+
+        if not self.config.http2 or self._http2_unavailable:
+            return requests.Session()
+
+        with self._http2_lock:
+            if self._http2_session is None:
+                try:
+                    self._http2_session = Http2Session(
+                        ssl_verify=self._ssl_verify,
+                        certfile=self.config.security.certfile,
+                        keyfile=self.config.security.keyfile,
+                        max_streams=self.config.http2_max_streams,
+                    )
+                except ImportError as exc:
+                    self._http2_unavailable = True
+                    logger.warning(
+                        'HTTP/2 unavailable, falling back to HTTP/1.1: %s',
+                        exc,
+                    )
+                    return requests.Session()
+
+            return self._http2_session
+
+    def close(self) -> None:
+        with self._http2_lock:
+            session, self._http2_session = self._http2_session, None
+
+        if session is not None:
+            session.shutdown()
+
+        with self._pipeline_lock:
+            executor, self._pipeline_executor = self._pipeline_executor, None
+
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+        super().close()
 
     @property
     def logger(self) -> HttpTransportLogger:
-        return HttpTransportLogger(
-            logger=logger,
-            enabled=self.config.use_logging,
-        )
+        if self._transport_logger is None:
+            self._transport_logger = HttpTransportLogger(
+                logger=logger,
+                enabled=self.config.use_logging,
+            )
+        return self._transport_logger
+
+    def log_batch(self, batch: Union[List[dict], EncodedBatch]) -> None:
+        if not self.logger.enabled:
+            return  # Skip encoding the batch only to measure it
+
+        if isinstance(batch, EncodedBatch):
+            options = (batch.length, len(batch))
+        else:
+            options = (len(batch), len(json.dumps(batch).encode('utf8')))
 
-    def log_batch(self, batch: List[dict]) -> None:
-        options = (len(batch), len(json.dumps(batch).encode('utf8')))
         message = 'Batch length: %s, Batch size: %s' % options
         self.logger.debug(message)
 
-    def send_batch(self, batch: dict) -> None:
-        try:
-            response = self.__session.post(
-                self.url,
-                headers=self.headers,
-                json=batch,
-                verify=self._ssl_verify,
-                timeout=self._timeout,
-            )
+    def send_batch(
+        self,
+        batch: dict,
+        session: Optional[requests.Session] = None,
+        raise_errors: bool = False,
+    ) -> None:
+        if session is None:
+            session = self.new_session()
 
-            if not response.ok:
-                self.__session.close()
-                response.raise_for_status()
+        try:
+            if self._endpoints is None:
+                self.post(session, self.url, batch, timeout=self._timeout)
+            else:
+                self.post_to_group(session, batch)
         except Exception as exc:
             self.logger.exception(exc)
+
+            if raise_errors:
+                raise
+
+    def post(
+        self,
+        session: requests.Session,
+        url: str,
+        batch: dict,
+        timeout: float,
+    ) -> None:
+        # Batches prepared by the pipeline are already encoded
+        body = {'data': batch} if isinstance(batch, bytes) else \
+            {'json': batch}
+
+        response = session.post(
+            url,
+            headers=self.headers,
+            verify=self._ssl_verify,
+            timeout=timeout,
+            **body,
+        )
+
+        if not response.ok:
+            session.close()
+            response.raise_for_status()
+
+    def post_to_group(self, session: requests.Session, batch: dict) -> None:
+        error = None
+
+        for endpoint in self._endpoints.candidates():
+            start = time.monotonic()
+
+            try:
+                self.post(session, endpoint.url, batch, endpoint.host.timeout)
+            except Exception as exc:
+                self._endpoints.report_failure(endpoint)
+                self.logger.warning(
+                    'Failed sending batch to %s: %s' % (endpoint.url, exc))
+                error = exc
+                continue
+
+            self._endpoints.report_success(endpoint, time.monotonic() - start)
+            break
+        else:
+            raise error
+
+        if self._mirror is None:
+            return
+
+        # Fan-out duplication is best effort, it never fails the batch
+        try:
+            self.post(
+                session, self._mirror.url, batch, self._mirror.host.timeout)
+        except Exception as exc:
+            self.logger.warning(
+                'Failed mirroring batch to %s: %s' % (self._mirror.url, exc))
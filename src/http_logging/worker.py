@@ -0,0 +1,653 @@
+from collections import deque
+from datetime import datetime
+from queue import Empty, Queue
+from threading import Event, Thread
+import time
+from typing import Optional
+
+import logstash_async
+from logstash_async.database import DatabaseDiskIOError, DatabaseLockedError
+from logstash_async.worker import LogProcessingWorker, NETWORK_EXCEPTIONS
+
+import http_logging
+from http_logging.cache import HttpDatabaseCache, HttpMemoryCache
+from http_logging.transport import AsyncHttpTransport
+
+
+# `ssl_verify_flags` is only accepted by python-logstash-async 4+
+SSL_VERIFY_FLAGS_SUPPORTED = \
+    int(logstash_async.__version__.split('.')[0]) >= 4
+
+
+class DrainRequest:
+    '''Deadline-bound request to ship everything buffered by a worker'''
+
+    def __init__(self, timeout: float) -> None:
+        self.deadline = time.monotonic() + timeout
+        self.shipped = 0
+        self.deferred = 0
+        self._done = Event()
+
+    @property
+    def remaining(self) -> float:
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    @property
+    def result(self) -> http_logging.FlushResult:
+        return http_logging.FlushResult(
+            shipped=self.shipped,
+            deferred=self.deferred,
+        )
+
+    def finish(self, deferred: int) -> None:
+        self.deferred = deferred
+        self._done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+
+class AsyncHttpWorker(LogProcessingWorker):
+    '''Log processing worker tuned by a `ConfigLog` instead of the
+    process-global `logstash_async` constants.
+
+    Events enqueued with `enqueue_priority_event` skip the cache and are
+    sent ahead of any queued or backlogged regular events.
+
+    With `ConfigLog.flush_max_delay` set, the worker sleeps until it is
+    woken by an event and ships cached events once the oldest one has waited
+    `flush_max_delay` seconds or `flush_max_bytes` are cached, whichever
+    comes first, instead of polling the queue every `queue_check_interval`.
+    '''
+
+    def __init__(self, *args, config: http_logging.ConfigLog, **kwargs):
+        self.config = config
+
+        ssl_verify_flags = kwargs.pop('ssl_verify_flags', None)
+        if SSL_VERIFY_FLAGS_SUPPORTED:
+            kwargs['ssl_verify_flags'] = ssl_verify_flags
+
+        super().__init__(*args, **kwargs)
+
+        self._wakeup_event = Event()
+        self._priority_queue = deque()
+        self._priority_lane_down = False
+        self._drain_requests = deque()
+        self._flush_on_shutdown = True
+        self._sent_events = []
+        self._draining_backlog = False
+        self._maintenance_due_at = \
+            time.monotonic() + (self.config.maintenance_interval or 0.0)
+        self._maintenance_report = None
+        self.last_maintenance_report = None
+
+        # Event-driven flush scheduling
+        self._event_driven = config.flush_max_delay is not None
+        self._flush_due_at = None
+        self._pending_bytes = 0
+
+    @property
+    def pending_event_count(self) -> int:
+        '''Approximate count of events not shipped yet'''
+        return self._queue.qsize() + len(self._priority_queue) + \
+            (self._non_flushed_event_count or 0)
+
+    def enqueue_event(self, event) -> None:
+        # called from other threads
+        super().enqueue_event(event)
+
+        if self._event_driven and not self._wakeup_event.is_set():
+            self._wakeup_event.set()
+
+    def force_flush_queued_events(self) -> None:
+        # called from other threads
+        super().force_flush_queued_events()
+        self._wakeup_event.set()
+
+    def enqueue_priority_event(self, event) -> None:
+        # called from other threads
+        self._priority_queue.append((time.monotonic(), event))
+        self._wakeup_event.set()
+
+    def request_drain(self, timeout: float) -> DrainRequest:
+        # called from other threads
+        request = DrainRequest(timeout=timeout)
+
+        self._drain_requests.append(request)
+        self._wakeup_event.set()
+
+        return request
+
+    def shutdown(self, flush: bool = True) -> None:
+        # called from other threads
+        self._flush_on_shutdown = flush
+
+        super().shutdown()
+        self._wakeup_event.set()
+
+    def _setup_database(self):
+        self._database = self._open_cache()
+        self._non_flushed_event_count = \
+            self._database.get_non_flushed_event_count()
+
+        if self._event_driven and self._non_flushed_event_count:
+            self._flush_due_at = time.monotonic()  # Left by a previous run
+
+    def _open_cache(self):
+        if self._database_path:
+            return HttpDatabaseCache(
+                path=self._database_path,
+                event_ttl=self._event_ttl,
+                batch_size=self.config.queued_events_batch_size,
+                timeout=self.config.database_timeout,
+            )
+
+        return HttpMemoryCache(
+            cache=self._memory_cache,
+            event_ttl=self._event_ttl,
+            batch_size=self.config.queued_events_batch_size,
+        )
+
+    def _fetch_event(self):
+        # Database errors raised before the next event is taken must not
+        # requeue the previous one
+        self._event = None
+
+        while self._drain_requests:
+            self._drain(self._drain_requests.popleft())
+
+        self._flush_priority_events()
+
+        # Under sustained load the queue is never empty: ship when due
+        # instead of waiting for it to be
+        if self._event_driven:
+            self._flush_queued_events()
+
+        super()._fetch_event()
+
+    def _requeue_event(self):
+        if self._event is not None:
+            super()._requeue_event()
+
+    def _write_event_to_database(self):
+        super()._write_event_to_database()
+
+        if self._event_driven:
+            self._pending_bytes += self._event_size(self._event)
+
+            if self._flush_due_at is None:
+                self._flush_due_at = \
+                    time.monotonic() + self.config.flush_max_delay
+
+    def _drain(self, request: DrainRequest) -> None:
+        try:
+            self._cache_buffered_events()
+            self._ship_concurrently(request)
+        except Exception as exc:
+            self._safe_log(
+                'exception',
+                'An error occurred while draining events: %s',
+                exc,
+                exc=exc,
+            )
+        finally:
+            request.finish(deferred=self._count_deferred_events())
+
+    def _cache_buffered_events(self) -> None:
+        while self._priority_queue:
+            self._database.add_event(self._priority_queue.popleft()[1])
+            self._non_flushed_event_count += 1
+
+        self._cache_queued_events()
+
+    def _cache_queued_events(self) -> None:
+        while True:
+            try:
+                self._event = self._queue.get(block=False)
+            except Empty:
+                break
+
+            self._write_event_to_database()
+            self._event = None
+
+    def _ship_concurrently(self, request: DrainRequest) -> None:
+        # Third-party transports may not support concurrent sends
+        concurrency = self.config.drain_concurrency \
+            if self._supports_concurrent_sends() else 1
+
+        results = Queue()
+        in_flight = {}
+        failed = False
+
+        while request.remaining > 0:
+            while not failed and len(in_flight) < concurrency:
+                queued_events = self._fetch_queued_events_for_flush()
+                if not queued_events:
+                    break
+
+                batch_id = id(queued_events)
+                in_flight[batch_id] = queued_events
+
+                Thread(
+                    target=self._send_in_thread,
+                    args=(batch_id, queued_events, results),
+                    daemon=True,
+                ).start()
+
+            if not in_flight:
+                break
+
+            try:
+                batch_id, exc = results.get(timeout=request.remaining)
+            except Empty:
+                break
+
+            queued_events = in_flight.pop(batch_id)
+
+            if exc is None:
+                self._delete_events_from_database(queued_events)
+                request.shipped += len(queued_events)
+            else:
+                # Stop sending more: the collector is likely unavailable
+                self._database.requeue_queued_events(queued_events)
+                failed = True
+
+        # Deadline reached: keep in-flight events for the next flush/start
+        for queued_events in in_flight.values():
+            self._database.requeue_queued_events(queued_events)
+
+    def _send_in_thread(
+        self,
+        batch_id: int,
+        queued_events: list,
+        results: Queue,
+    ) -> None:
+        try:
+            self._send_queued_events(queued_events)
+        except Exception as exc:
+            results.put((batch_id, exc))
+        else:
+            results.put((batch_id, None))
+
+    def _count_deferred_events(self) -> int:
+        buffered = self._queue.qsize() + len(self._priority_queue)
+
+        try:
+            self._non_flushed_event_count = \
+                self._database.get_non_flushed_event_count()
+        except Exception:  # Database locked, keep the last known count
+            pass
+
+        return buffered + self._non_flushed_event_count
+
+    def _fetch_queued_events_for_flush(self):
+        # Priority events go out ahead of every backlogged batch
+        self._flush_priority_events(force=self._shutdown_requested())
+        return super()._fetch_queued_events_for_flush()
+
+    def _flush_priority_events(self, force: bool = False) -> None:
+        if not self._priority_queue:
+            return
+
+        if not force and self._priority_flush_wait() > 0:
+            return
+
+        events = []
+        while self._priority_queue:
+            events.append(self._priority_queue.popleft()[1])
+
+        # After a failure, do not block on the collector for every burst:
+        # wait for regular flushes, and their retry interval, to succeed
+        if self._priority_lane_down:
+            self._requeue_priority_events(events)
+            return
+
+        try:
+            self._send_events(events)
+        except Exception as exc:
+            self._safe_log(
+                'warning',
+                'An error occurred while sending priority events: %s',
+                exc,
+            )
+            self._priority_lane_down = True
+            self._requeue_priority_events(events)
+
+    def _requeue_priority_events(self, events: list) -> None:
+        # Fall back to the cache, events are shipped with regular ones
+        for event in events:
+            self._queue.put(event)
+
+    def _flush_queued_events(self, force=False):
+        if self._shutdown_requested() and not self._flush_on_shutdown:
+            return
+
+        if not force and not self._queued_event_interval_reached() and \
+                not self._queued_event_count_reached():
+            return
+
+        self._clear_flush_event()
+
+        try:
+            shipped = self._flush_all_queued_events()
+        except (DatabaseLockedError, DatabaseDiskIOError) as exc:
+            self._safe_log(
+                'debug',
+                'Database unavailable, flush postponed: %s',
+                exc,
+            )
+            shipped = False
+
+        if self._event_driven:
+            self._schedule_next_flush(shipped)
+
+    def _flush_all_queued_events(self) -> bool:
+        '''Returns False if events are left in the cache after a failure, or
+        to serve a drain request first'''
+        if self._backlog_reached() and not self._drain_backlog():
+            # Failed, or interrupted: the rest is shipped by a later flush
+            return False
+
+        while True:
+            if self._drain_requests or self._shutdown_interrupts_flush():
+                return False
+
+            queued_events = self._fetch_queued_events_for_flush()
+
+            # None if the cache could not be read, e.g. locked
+            if queued_events is None:
+                return False
+            if not queued_events:
+                return True
+
+            if not self._ship_queued_events(queued_events):
+                return False
+
+            self._reset_flush_counters()
+
+    def _shutdown_interrupts_flush(self) -> bool:
+        return self._shutdown_requested() and not self._flush_on_shutdown
+
+    def _schedule_next_flush(self, shipped: bool) -> None:
+        self._pending_bytes = 0
+
+        if shipped:
+            self._flush_due_at = None
+        else:
+            # Retry after a pause, as the collector is likely unavailable
+            self._flush_due_at = \
+                time.monotonic() + self.config.queued_events_flush_interval
+
+    def _backlog_reached(self) -> bool:
+        threshold = self.config.backlog_threshold
+
+        return threshold is not None and \
+            isinstance(self._database, HttpDatabaseCache) and \
+            self._non_flushed_event_count >= threshold
+
+    def _drain_backlog(self) -> Optional[bool]:
+        '''Stream the cache to the transport in large chunks, deleting the
+        events of each acknowledged chunk. Returns False if sending failed,
+        None if interrupted by a drain request or a shutdown without flush.
+        '''
+        self._draining_backlog = True
+        started_at = time.monotonic()
+        shipped = 0
+
+        try:
+            chunks = self._database.iter_pending_event_chunks(
+                chunk_size=self.config.backlog_chunk_size)
+
+            for chunk in chunks:
+                self._flush_priority_events()
+
+                if self._drain_requests or self._shutdown_interrupts_flush():
+                    return None
+
+                try:
+                    self._send_queued_events(chunk)
+                except Exception as exc:
+                    self._safe_log(
+                        'warning',
+                        'An error occurred while draining the backlog: %s',
+                        exc,
+                    )
+                    return False
+
+                # Not by range: other processes sharing the cache may have
+                # taken events of the chunk in flight, then requeued them
+                self._database.delete_event_ids(
+                    [event['event_id'] for event in chunk])
+                shipped += len(chunk)
+
+                # Keep memory flat: new events are streamed after the backlog
+                self._cache_queued_events()
+                self._throttle_backlog(shipped, started_at)
+        except (DatabaseLockedError, DatabaseDiskIOError) as exc:
+            self._safe_log(
+                'debug',
+                'Database unavailable, backlog drain paused: %s',
+                exc,
+            )
+            return False
+        finally:
+            self._draining_backlog = False
+            self._count_deferred_events()
+
+        return True
+
+    def _throttle_backlog(self, shipped: int, started_at: float) -> None:
+        rate_limit = self.config.backlog_rate_limit
+        if not rate_limit:
+            return
+
+        delay = shipped / rate_limit - (time.monotonic() - started_at)
+        if delay > 0:
+            self._shutdown_event.wait(delay)
+
+    def _expire_events(self):
+        super()._expire_events()
+
+        if self._maintenance_enabled():
+            self._run_maintenance()
+
+    def _maintenance_enabled(self) -> bool:
+        return self.config.maintenance_interval is not None and \
+            isinstance(self._database, HttpDatabaseCache)
+
+    def _maintenance_preempted(self) -> bool:
+        '''Maintenance only runs while the worker is otherwise idle'''
+        return self._shutdown_requested() or self._backlog_reached() or \
+            bool(self._drain_requests) or bool(self._priority_queue) or \
+            not self._queue.empty()
+
+    def _run_maintenance(self) -> None:
+        '''Expire events, release free pages and refresh query planner
+        statistics, a chunk at a time.
+
+        A run yields as soon as the worker has other work and carries on at
+        its next idle moment, until it completes.
+        '''
+        if time.monotonic() < self._maintenance_due_at or \
+                self._maintenance_preempted():
+            return
+
+        if self._maintenance_report is None:
+            self._maintenance_report = http_logging.MaintenanceReport()
+
+        report = self._maintenance_report
+        chunk_size = self.config.maintenance_chunk_size
+        started_at = time.monotonic()
+
+        try:
+            while True:
+                if self._maintenance_preempted():
+                    return
+
+                expired = self._database.expire_event_chunk(limit=chunk_size)
+                report.expired += expired
+
+                if expired < chunk_size:
+                    break
+
+            while True:
+                if self._maintenance_preempted():
+                    return
+
+                reclaimed = self._database.incremental_vacuum(
+                    pages=chunk_size)
+                report.reclaimed += reclaimed
+
+                if reclaimed <= 0:
+                    break
+
+            self._database.optimize()
+            report.size = self._database.get_size()
+        except (DatabaseLockedError, DatabaseDiskIOError) as exc:
+            self._safe_log(
+                'debug',
+                'Database unavailable, cache maintenance paused: %s',
+                exc,
+            )
+            return
+        finally:
+            report.duration += time.monotonic() - started_at
+
+        if report.expired:
+            self._count_deferred_events()
+
+        self._maintenance_report = None
+        self._maintenance_due_at = \
+            time.monotonic() + self.config.maintenance_interval
+        self.last_maintenance_report = report
+
+        self._safe_log(
+            'info',
+            'Cache maintenance: %s events expired, %s bytes reclaimed, '
+            '%s bytes in use (%.3fs)',
+            report.expired,
+            report.reclaimed,
+            report.size,
+            report.duration,
+        )
+
+    def _ship_queued_events(self, queued_events: list) -> bool:
+        try:
+            self._send_queued_events(queued_events)
+        # Log connection and network errors as warnings as they are rather
+        # harmless
+        except NETWORK_EXCEPTIONS as exc:
+            self._safe_log(
+                'warning',
+                'An error occurred while sending events: %s',
+                exc,
+            )
+            self._database.requeue_queued_events(queued_events)
+            return False
+        except Exception as exc:
+            self._safe_log(
+                'exception',
+                'An error occurred while sending events: %s',
+                exc,
+                exc=exc,
+            )
+            self._database.requeue_queued_events(queued_events)
+            return False
+
+        self._priority_lane_down = False
+
+        # Only delete what was sent, a drain may have other events in flight
+        self._delete_events_from_database(queued_events)
+        return True
+
+    def _delete_events_from_database(self, queued_events: list) -> None:
+        self._sent_events.extend(queued_events)
+
+        try:
+            self._database.delete_events(self._sent_events)
+        except (DatabaseLockedError, DatabaseDiskIOError):
+            return  # Retried along with the next deletion
+
+        self._sent_events = []
+
+    def _event_size(self, event) -> int:
+        return len(event)
+
+    def _supports_concurrent_sends(self) -> bool:
+        return isinstance(self._transport, AsyncHttpTransport)
+
+    def _send_queued_events(self, queued_events: list) -> None:
+        self._send_events([e['event_text'] for e in queued_events])
+
+    def _send_events(self, events):
+        if not isinstance(self._transport, AsyncHttpTransport):
+            return super()._send_events(events)
+
+        # Surface failed batches, so events are requeued instead of deleted
+        self._transport.send(
+            events,
+            use_logging=not self._shutdown_requested(),
+            raise_errors=True,
+        )
+
+    def _priority_flush_wait(self) -> float:
+        '''Seconds left until the oldest priority event is due'''
+        if not self._priority_queue:
+            return self.config.queue_check_interval
+
+        enqueued_at = self._priority_queue[0][0]
+        deadline = enqueued_at + self.config.priority_flush_delay
+
+        return max(deadline - time.monotonic(), 0.0)
+
+    def _delay_processing(self):
+        if self._event_driven:
+            timeout = self._next_wakeup()
+        else:
+            timeout = min(
+                self.config.queue_check_interval,
+                self._priority_flush_wait(),
+            )
+
+        self._wakeup_event.wait(timeout)
+        self._wakeup_event.clear()
+
+    def _next_wakeup(self) -> Optional[float]:
+        '''Seconds until the next scheduled task, None if there is none'''
+        now = time.monotonic()
+        deadlines = []
+
+        if not self._queue.empty():  # Requeued after a database error
+            deadlines.append(now + self.config.queue_check_interval)
+
+        if self._flush_due_at is not None:
+            deadlines.append(self._flush_due_at)
+
+        if self._priority_queue:
+            deadlines.append(now + self._priority_flush_wait())
+
+        if self._maintenance_enabled():
+            deadlines.append(self._maintenance_due_at)
+
+        if not deadlines:
+            return None
+
+        return max(min(deadlines) - now, 0.0)
+
+    def _queued_event_interval_reached(self):
+        if self._event_driven:
+            return self._flush_due_at is not None and \
+                time.monotonic() >= self._flush_due_at
+
+        # python-logstash-async 4+ stores timezone-aware dates
+        last_flush_date = self._last_event_flush_date
+        delta = datetime.now(tz=last_flush_date.tzinfo) - last_flush_date
+        return delta.total_seconds() > \
+            self.config.queued_events_flush_interval
+
+    def _queued_event_count_reached(self):
+        if self._event_driven:
+            return self._pending_bytes >= self.config.flush_max_bytes
+
+        return self._non_flushed_event_count > \
+            self.config.queued_events_flush_count
@@ -12,7 +12,7 @@ from http_logging.transport import AsyncHttpTransport
 logging.Formatter.converter = time.gmtime
 
 
-def test_handler(run_localserver, localhost):
+def test_handler(run_localserver, localhost, request):
     custom_path = 'foo-bar-path'
     custom_header_dict = {'Foo': 'Bar'}
 
@@ -54,6 +54,10 @@ def test_handler(run_localserver, localhost):
     logger.setLevel(logging.DEBUG)
     logger.addHandler(log_handler)
 
+    # Release the cache file for the other tests
+    request.addfinalizer(log_handler.close)
+    request.addfinalizer(lambda: logger.removeHandler(log_handler))
+
     logged_messages = {
         'debug': 'Does this help debugging?',
         'info': 'Some information...',
@@ -0,0 +1,147 @@
+import gzip
+import json
+import sqlite3
+from unittest import mock
+
+import pytest
+
+from http_logging import cli
+from http_logging.cache import HttpDatabaseCache
+from http_logging.transport import AsyncHttpTransport
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / 'logging-cache.db')
+    cache = HttpDatabaseCache(path=path)
+
+    # Encoded and newline-terminated, as cached by the handler
+    for i in range(25):
+        cache.add_event(json.dumps({'message': f'event-{i}'}).encode() + b'\n')
+
+    return path
+
+
+def read_export(path) -> list:
+    with gzip.open(path, 'rt') as file:
+        return [json.loads(line)['message'] for line in file]
+
+
+def test_inspect(database, capsys):
+    assert cli.main(['inspect', database]) == 0
+
+    output = capsys.readouterr().out
+
+    assert 'Pending:    25 events' in output
+    assert 'In flight:  0 events' in output
+    assert 'Size:' in output
+
+
+def test_inspect_not_a_cache(tmp_path, capsys):
+    path = tmp_path / 'events.txt'
+    path.write_text('not a database')
+
+    assert cli.main(['inspect', str(path)]) == 1
+    assert 'is not a SQLite cache' in capsys.readouterr().err
+
+
+def test_export(database, tmp_path):
+    output = tmp_path / 'export'
+
+    exit_code = cli.main([
+        'export', database,
+        '--output', str(output),
+        '--events-per-file', '10',
+        '--delete',
+    ])
+
+    assert exit_code == 0
+    assert sorted(p.name for p in output.iterdir()) == [
+        'events-00001.ndjson.gz',
+        'events-00002.ndjson.gz',
+        'events-00003.ndjson.gz',
+    ]
+    assert read_export(output / 'events-00001.ndjson.gz') == \
+        [f'event-{i}' for i in range(10)]
+    assert read_export(output / 'events-00003.ndjson.gz') == \
+        [f'event-{i}' for i in range(20, 25)]
+
+    cache = HttpDatabaseCache(path=database)
+    assert cache.get_non_flushed_event_count() == 0
+
+
+def test_export_events_requeued_meanwhile(database, tmp_path):
+    with sqlite3.connect(database) as connection:
+        connection.execute(
+            'UPDATE `event` SET `pending_delete` = 1 '
+            'WHERE `event_id` BETWEEN 4 AND 6;')
+    connection.close()
+
+    iter_pending_event_chunks = HttpDatabaseCache.iter_pending_event_chunks
+
+    def requeue_after_read(cache, chunk_size):
+        yield from iter_pending_event_chunks(cache, chunk_size)
+
+        # The handler failed to ship the events it had in flight
+        with sqlite3.connect(database) as connection:
+            connection.execute('UPDATE `event` SET `pending_delete` = 0;')
+        connection.close()
+
+    with mock.patch.object(HttpDatabaseCache, 'iter_pending_event_chunks',
+                           requeue_after_read):
+        cli.main([
+            'export', database,
+            '--output', str(tmp_path / 'export'),
+            '--delete',
+        ])
+
+    # Left in the cache, for the handler or the next export
+    cache = HttpDatabaseCache(path=database)
+    assert [
+        json.loads(event['event_text'])['message']
+        for event in cache.get_queued_events()
+    ] == ['event-3', 'event-4', 'event-5']
+
+
+def test_export_never_overwrites(database, tmp_path):
+    output = str(tmp_path / 'export')
+
+    assert cli.main(['export', database, '--output', output]) == 0
+    assert cli.main(['export', database, '--output', output]) == 1
+
+
+@mock.patch.object(AsyncHttpTransport, 'send')
+def test_replay_export(send, database, tmp_path):
+    output = tmp_path / 'export'
+    cli.main(['export', database, '--output', str(output)])
+
+    exit_code = cli.main([
+        'replay', str(output),
+        '--host', 'collector.local',
+        '--batch-size', '10',
+    ])
+
+    batches = [c.args[0] for c in send.mock_calls]
+
+    assert exit_code == 0
+    assert sorted(len(batch) for batch in batches) == [5, 10, 10]
+    assert all(c.kwargs['raise_errors'] for c in send.mock_calls)
+
+
+@mock.patch.object(AsyncHttpTransport, 'send')
+def test_replay_cache(send, database):
+    send.side_effect = [None, ConnectionError('Collector down'), None]
+
+    exit_code = cli.main([
+        'replay', database,
+        '--host', 'collector.local',
+        '--batch-size', '10',
+        '--concurrency', '1',
+        '--delete',
+    ])
+
+    assert exit_code == 1
+
+    # The failed batch stays in the cache
+    cache = HttpDatabaseCache(path=database)
+    assert cache.get_non_flushed_event_count() == 10
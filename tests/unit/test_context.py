@@ -0,0 +1,91 @@
+import asyncio
+import json
+import logging
+import threading
+
+import http_logging
+from http_logging.formatter import HttpLogFormatter
+
+
+def build_record():
+    return logging.LogRecord(
+        name='test_context',
+        level=logging.INFO,
+        pathname=__file__,
+        lineno=1,
+        msg='Some message',
+        args=(),
+        exc_info=None,
+    )
+
+
+def test_bind_and_unbind():
+    token = http_logging.bind_context(request_id='abc', tenant_id='acme')
+
+    assert http_logging.get_context() == \
+        {'request_id': 'abc', 'tenant_id': 'acme'}
+
+    http_logging.unbind_context('tenant_id')
+
+    assert http_logging.get_context() == {'request_id': 'abc'}
+
+    with http_logging.log_context(trace_id='t-1') as context:
+        assert context == {'request_id': 'abc', 'trace_id': 't-1'}
+
+    assert http_logging.get_context() == {'request_id': 'abc'}
+
+    http_logging.reset_context(token)
+
+    assert http_logging.get_context() == {}
+
+
+def test_formatter_splices_context():
+    formatter = HttpLogFormatter()
+
+    event = json.loads(formatter.format(build_record()))
+    assert 'context' not in event
+
+    with http_logging.log_context(request_id='abc'):
+        event = json.loads(formatter.format(build_record()))
+
+    assert event['context'] == {'request_id': 'abc'}
+
+    schema = http_logging.HttpLogSchema(include_fields=['context'])
+    formatter = HttpLogFormatter(schema=schema)
+
+    with http_logging.log_context(request_id='abc'):
+        event = json.loads(formatter.format(build_record()))
+
+    assert event == {'context': {'request_id': 'abc'}}
+
+
+def test_context_isolated_across_threads():
+    results = {}
+
+    def run(name):
+        with http_logging.log_context(thread=name):
+            barrier.wait()
+            results[name] = http_logging.get_context()
+
+    barrier = threading.Barrier(2)
+    threads = [threading.Thread(target=run, args=(n,)) for n in 'ab']
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {'a': {'thread': 'a'}, 'b': {'thread': 'b'}}
+
+
+def test_context_isolated_across_tasks():
+    async def run(name):
+        http_logging.bind_context(task=name)
+        await asyncio.sleep(0)
+        return http_logging.get_context()
+
+    async def main():
+        return await asyncio.gather(run('a'), run('b'))
+
+    assert asyncio.run(main()) == [{'task': 'a'}, {'task': 'b'}]
+    assert http_logging.get_context() == {}
@@ -0,0 +1,274 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+import http_logging
+from http_logging.cache import PartitionedDatabaseCache, PartitionedMemoryCache
+from http_logging.dispatcher import HttpDispatcher
+from http_logging.handler import AsyncHttpHandler
+from http_logging.transport import AsyncHttpTransport
+
+
+def build_transport(url):
+    transport = mock.NonCallableMock(spec=AsyncHttpTransport)
+    transport.url = url
+    return transport
+
+
+@pytest.fixture
+def get_handler():
+    dispatcher = HttpDispatcher(config=http_logging.ConfigLog(
+        database_path=None,
+        queued_events_flush_interval=3600,
+        queued_events_flush_count=1000,
+    ))
+    handlers = []
+
+    def build(url):
+        handler = AsyncHttpHandler(
+            http_host=http_logging.HttpHost(name='dummy-host.com'),
+            transport_class=build_transport(url),
+            dispatcher=dispatcher,
+        )
+        handlers.append(handler)
+        return handler
+
+    yield build
+
+    for handler in handlers:
+        handler.close()
+
+
+def emit(handler, *messages):
+    for message in messages:
+        handler.emit(logging.makeLogRecord({'msg': message}))
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def sent_messages(transport):
+    return [
+        [json.loads(event)['message'] for event in call.args[0]]
+        for call in transport.send.call_args_list
+    ]
+
+
+def test_handlers_share_one_worker(get_handler):
+    audit = get_handler('https://audit.example.com/logs')
+    errors = get_handler('https://errors.example.com/logs')
+
+    emit(audit, 'audit-1', 'audit-2')
+    emit(errors, 'error-1')
+
+    assert audit._worker_thread is errors._worker_thread
+
+    audit.flush(timeout=5)
+
+    # One upload per destination, each through its own transport
+    assert sent_messages(audit._transport) == [['audit-1', 'audit-2']]
+    assert sent_messages(errors._transport) == [['error-1']]
+
+
+def test_uploads_coalesced_per_url(get_handler):
+    first = get_handler('https://logs.example.com/')
+    second = get_handler('https://logs.example.com/')
+
+    emit(first, 'first')
+    emit(second, 'second')
+
+    first.flush(timeout=5)
+
+    assert sent_messages(first._transport) == [['first', 'second']]
+    second._transport.send.assert_not_called()
+
+
+def test_worker_stops_with_last_handler(get_handler):
+    first = get_handler('https://first.example.com/')
+    second = get_handler('https://second.example.com/')
+
+    emit(first, 'first')
+    emit(second, 'second')
+    worker = first._worker_thread
+
+    first.close()
+    assert worker.is_alive()
+
+    second.close()
+    assert not worker.is_alive()
+
+    # Both streams flushed on shutdown
+    assert sent_messages(first._transport) == [['first']]
+    assert sent_messages(second._transport) == [['second']]
+
+
+def test_unregister_does_not_block_other_handlers(get_handler):
+    collector = threading.Event()
+
+    first = get_handler('https://first.example.com/')
+    first._transport.send.side_effect = lambda *args, **kwargs: \
+        collector.wait(5)
+    emit(first, 'first')
+
+    # The final flush waits for an unresponsive collector
+    closing = threading.Thread(target=first.close)
+    closing.start()
+
+    try:
+        assert wait_for(lambda: first._transport.send.called)
+
+        second = get_handler('https://second.example.com/')
+        emit(second, 'second')
+
+        assert closing.is_alive()
+        assert second._worker_thread.is_alive()
+    finally:
+        collector.set()
+        closing.join(timeout=5)
+
+    second.flush(timeout=5)
+
+    assert sent_messages(second._transport) == [['second']]
+
+
+def test_shared_connection_pool():
+    dispatcher = HttpDispatcher()
+    transports = [
+        AsyncHttpTransport(
+            http_host=http_logging.HttpHost(name=name),
+            config=http_logging.ConfigLog(),
+        )
+        for name in ('first.example.com', 'second.example.com')
+    ]
+
+    with mock.patch.object(HttpDispatcher, '_start_worker'):
+        for transport in transports:
+            dispatcher.register(handler=mock.Mock(), transport=transport)
+
+    session = transports[0].new_session()
+
+    assert session is transports[1].new_session()
+    assert session is dispatcher._session
+
+    with mock.patch.object(session, 'post') as post, \
+            mock.patch.object(session, 'close') as close:
+        post.return_value.ok = True
+        transports[0].send(['{"message": "shared"}'])
+
+    post.assert_called_once()
+    close.assert_not_called()
+
+    dispatcher._close_session()
+    assert transports[0].shared_session is None
+
+
+def test_partitioned_database_cache(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    streams = ['a', 'b']
+
+    # Caches created before partitioning are migrated in place
+    with sqlite3.connect(path) as connection:
+        connection.execute(
+            'CREATE TABLE `event` (`event_id` INTEGER NOT NULL PRIMARY KEY '
+            'AUTOINCREMENT, `event_text` TEXT NOT NULL, `pending_delete` '
+            'INTEGER NOT NULL, `entry_date` DATETIME NOT NULL);')
+    connection.close()
+
+    cache = PartitionedDatabaseCache(
+        path=path, batch_size=2, streams=lambda: streams)
+
+    for stream, event in [('a', 'a1'), ('b', 'b1'), ('a', 'a2'),
+                          ('a', 'a3'), ('c', 'c1')]:
+        cache.add_event((stream, event))
+
+    batches = [
+        [(row['stream'], row['event_text']) for row in events]
+        for events in iter(cache.get_queued_events, [])
+    ]
+
+    # Streams take turns, unknown streams are left in the cache
+    assert batches == [
+        [('a', 'a1'), ('a', 'a2')],
+        [('b', 'b1')],
+        [('a', 'a3')],
+    ]
+    assert cache.get_non_flushed_event_count() == 1
+
+
+def test_partitioned_memory_cache():
+    cache = PartitionedMemoryCache(
+        cache={}, batch_size=2, streams=lambda: ['a', 'b'])
+
+    for event in [('b', 'b1'), ('a', 'a1'), ('b', 'b2'), ('b', 'b3')]:
+        cache.add_event(event)
+
+    batches = list(iter(cache.get_queued_events, []))
+
+    assert [
+        [(row['stream'], row['event_text']) for row in events]
+        for events in batches
+    ] == [
+        [('a', 'a1')],
+        [('b', 'b1'), ('b', 'b2')],
+        [('b', 'b3')],
+    ]
+
+    for events in batches:
+        cache.delete_events(events)
+
+    assert cache._cache == {}
+
+
+def test_cached_events_of_idle_handlers(tmp_path):
+    path = str(tmp_path / 'cache.db')
+
+    # Left by a previous run
+    cache = PartitionedDatabaseCache(path=path, streams=lambda: [])
+    cache.add_event(('https://errors.example.com/', '{"message": "left"}'))
+
+    dispatcher = HttpDispatcher(config=http_logging.ConfigLog(
+        database_path=path,
+        queued_events_flush_interval=3600,
+        queued_events_flush_count=1000,
+    ))
+    audit, errors = [
+        AsyncHttpHandler(
+            http_host=http_logging.HttpHost(name='dummy-host.com'),
+            transport_class=build_transport(f'https://{name}.example.com/'),
+            dispatcher=dispatcher,
+        )
+        for name in ('audit', 'errors')
+    ]
+
+    # Shipped along with the events of the handler logging
+    emit(audit, 'audit')
+    audit.flush(timeout=5)
+
+    assert sent_messages(audit._transport) == [['audit']]
+    assert sent_messages(errors._transport) == [['left']]
+
+    audit.close()
+    errors.close()
+
+
+def test_default_database_path():
+    assert HttpDispatcher().config.database_path == \
+        'logging-dispatcher-cache.db'
+
+    config = http_logging.ConfigLog()
+    dispatcher = HttpDispatcher(config=config)
+
+    # Not shared with handlers without a dispatcher
+    assert dispatcher.config.database_path == 'logging-dispatcher-cache.db'
+    assert config.database_path == 'logging-cache.db'
+    assert HttpDispatcher(config=http_logging.ConfigLog(
+        database_path='dispatcher.db')).config.database_path == 'dispatcher.db'
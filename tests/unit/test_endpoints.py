@@ -0,0 +1,84 @@
+import pytest
+
+import http_logging
+from http_logging.endpoints import Endpoint, EndpointPool
+
+
+def build_pool(strategy, count=3, **kwargs):
+    hosts = [
+        http_logging.HttpHost(name=f'collector-{i}.com')
+        for i in range(count)
+    ]
+    group = http_logging.HttpHostGroup(
+        hosts=hosts,
+        strategy=strategy,
+        **kwargs,
+    )
+
+    return EndpointPool(
+        group=group,
+        endpoints=[Endpoint(host=host, url=host.name) for host in hosts],
+    )
+
+
+def urls(endpoints):
+    return [endpoint.url for endpoint in endpoints]
+
+
+def test_group_describes_primary_host():
+    group = http_logging.HttpHostGroup(hosts=[
+        http_logging.HttpHost(name='primary.com', port=8080, path='logs'),
+        http_logging.HttpHost(name='secondary.com'),
+    ])
+
+    assert (group.name, group.port, group.path) == \
+        ('primary.com', 8080, 'logs')
+
+
+def test_group_validation():
+    with pytest.raises(ValueError):
+        http_logging.HttpHostGroup(hosts=[])
+
+    with pytest.raises(ValueError):
+        http_logging.HttpHostGroup(
+            hosts=[http_logging.HttpHost(name='collector.com')],
+            strategy='random',
+        )
+
+
+def test_round_robin():
+    pool = build_pool(strategy='round_robin')
+
+    first = [pool.candidates()[0].url for _ in range(3)]
+
+    assert sorted(first) == urls(pool.endpoints)
+
+
+def test_least_latency():
+    pool = build_pool(strategy='least_latency')
+
+    for endpoint, latency in zip(pool.endpoints, (0.3, 0.1, 0.2)):
+        pool.report_success(endpoint, latency)
+
+    assert urls(pool.candidates()) == \
+        ['collector-1.com', 'collector-2.com', 'collector-0.com']
+
+
+def test_failover_and_ejection():
+    pool = build_pool(strategy='failover', max_failures=2)
+    primary = pool.endpoints[0]
+
+    pool.report_failure(primary)
+
+    assert pool.candidates()[0] is primary
+
+    pool.report_failure(primary)
+
+    assert not primary.healthy
+    assert urls(pool.candidates()) == \
+        ['collector-1.com', 'collector-2.com', 'collector-0.com']
+
+    pool.report_success(primary, 0.1)
+
+    assert primary.healthy
+    assert pool.candidates()[0] is primary
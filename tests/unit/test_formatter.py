@@ -0,0 +1,172 @@
+import json
+import logging
+import sys
+import traceback
+from unittest import mock
+
+import pytest
+
+import http_logging
+from http_logging.formatter import HttpLogFormatter
+
+
+@pytest.fixture
+def get_record():
+    def build(msg='Some message', args=(), exc_info=None, **extra):
+        record = logging.LogRecord(
+            name='test_formatter',
+            level=logging.INFO,
+            pathname=__file__,
+            lineno=1,
+            msg=msg,
+            args=args,
+            exc_info=exc_info,
+        )
+        record.__dict__.update(extra)
+        return record
+
+    return build
+
+
+def test_format_default(get_record):
+    event = json.loads(HttpLogFormatter().format(get_record(foo='bar')))
+
+    assert event['message'] == 'Some message'
+    assert event['extra'] == {'foo': 'bar'}
+    assert {'relative_created', 'source_code', 'process', 'thread'} <= \
+        set(event.keys())
+
+
+def test_schema_field_projection(get_record):
+    record = get_record(foo='bar')
+
+    schema = http_logging.HttpLogSchema(
+        exclude_fields=['relative_created', 'process', 'thread', 'extra'])
+    event = json.loads(HttpLogFormatter(schema=schema).format(record))
+
+    assert set(event.keys()) == \
+        {'type', 'created', 'message', 'level', 'stack_trace', 'source_code'}
+
+    schema = http_logging.HttpLogSchema(include_fields=['message', 'level'])
+    event = json.loads(HttpLogFormatter(schema=schema).format(record))
+
+    assert set(event.keys()) == {'message', 'level'}
+
+
+def test_schema_text_caps(get_record):
+    try:
+        1/0
+    except ZeroDivisionError:
+        exc_info = sys.exc_info()
+
+    schema = http_logging.HttpLogSchema(
+        max_message_length=20,
+        max_stack_trace_length=30,
+        truncation_marker='[...]',
+    )
+    formatter = HttpLogFormatter(schema=schema)
+    record = get_record(msg='x' * 1000, exc_info=exc_info)
+
+    event = json.loads(formatter.format(record))
+
+    assert event['message'] == 'x' * 15 + '[...]'
+    assert len(event['stack_trace']) == 30
+    assert event['stack_trace'].endswith('[...]')
+
+
+def test_schema_extra_caps(get_record):
+    schema = http_logging.HttpLogSchema(
+        max_extra_depth=2,
+        max_extra_size=100,
+        truncation_marker='[...]',
+    )
+    formatter = HttpLogFormatter(schema=schema)
+    record = get_record(
+        nested={'level_1': {'level_2': {'level_3': 1}}},
+        huge=list(range(10000)),
+        rogue=object(),
+    )
+
+    event = json.loads(formatter.format(record))
+    extra = event['extra']
+
+    assert extra['nested'] == {'level_1': '[...]'}
+    assert extra['huge'][-1] == '[...]'
+    assert len(json.dumps(extra)) < 1000
+
+
+def test_structured_message(get_record):
+    formatter = HttpLogFormatter(structured_message=True)
+    record = get_record(msg='User %s logged in from %s', args=('joe', 'web'))
+
+    event = json.loads(formatter.format(record))
+
+    assert event['message'] == 'User joe logged in from web'
+    assert event['msg_template'] == 'User %s logged in from %s'
+    assert event['args'] == ['joe', 'web']
+
+    record = get_record(msg='%(count)d items', args=({'count': 3},))
+    event = json.loads(formatter.format(record))
+
+    assert event['args'] == {'count': 3}
+
+
+def test_structured_message_without_rendering(get_record):
+    formatter = HttpLogFormatter(structured_message=True, render_message=False)
+    record = get_record(msg='Took %s ms', args=(12,))
+
+    with mock.patch.object(logging.LogRecord, 'getMessage') as get_message:
+        event = json.loads(formatter.format(record))
+
+    get_message.assert_not_called()
+    assert 'message' not in event
+    assert event['msg_template'] == 'Took %s ms'
+    assert event['args'] == [12]
+
+
+def raise_error(user_id):
+    try:
+        {}[user_id]
+    except KeyError as exc:
+        raise ValueError(f'Unknown user {user_id}') from exc
+
+
+def capture(function, *args):
+    try:
+        function(*args)
+    except Exception:
+        return sys.exc_info()
+
+
+def test_traceback_cache(get_record):
+    formatter = HttpLogFormatter(traceback_cache_size=2)
+    cache = formatter.traceback_cache
+
+    for user_id in ('joe', 'ann', 'bob'):
+        exc_info = capture(raise_error, user_id)
+        event = json.loads(formatter.format(get_record(exc_info=exc_info)))
+
+        # Chained exceptions, each with its own message
+        assert event['stack_trace'] == \
+            ''.join(traceback.format_exception(*exc_info))
+        assert f'Unknown user {user_id}' in event['stack_trace']
+
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    # Least recently used entries are evicted
+    for function, arg in ((int, 'x'), ({}.pop, 'x'), (raise_error, 'joe')):
+        formatter.format(get_record(exc_info=capture(function, arg)))
+
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (2, 4)
+
+
+def test_traceback_cache_disabled(get_record):
+    formatter = HttpLogFormatter(traceback_cache_size=None)
+    exc_info = capture(raise_error, 'joe')
+
+    event = json.loads(formatter.format(get_record(exc_info=exc_info)))
+
+    assert formatter.traceback_cache is None
+    assert event['stack_trace'] == \
+        ''.join(traceback.format_exception(*exc_info))
@@ -0,0 +1,82 @@
+import logging
+import threading
+from unittest import mock
+
+import pytest
+
+from http_logging.context import bind_context, get_context, reset_context
+from http_logging.frontend import RecordConsumer, ShardedRecordBuffer
+
+
+def make_record(msg: str, created: float) -> logging.LogRecord:
+    record = logging.makeLogRecord({'msg': msg})
+    record.created = created
+    return record
+
+
+def test_shard_per_thread():
+    buffer = ShardedRecordBuffer(shards=4)
+
+    def produce(index):
+        buffer.append(make_record(f'thread-{index}', created=index))
+
+    threads = [threading.Thread(target=produce, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(len(shard) for shard in buffer.shards) == [1, 1, 1, 1]
+    assert len(buffer) == 4
+
+
+def test_pop_all_merges_in_creation_order():
+    buffer = ShardedRecordBuffer(shards=2)
+    buffer.shards[0].extend((make_record('a', t), None) for t in (1, 4, 5))
+    buffer.shards[1].extend((make_record('b', t), None) for t in (2, 3, 6))
+
+    entries = buffer.pop_all()
+
+    assert [e[0].created for e in entries] == [1, 2, 3, 4, 5, 6]
+    assert len(buffer) == 0
+
+
+def test_invalid_shards():
+    with pytest.raises(ValueError):
+        ShardedRecordBuffer(shards=0)
+
+
+def test_consumer_runs_dispatch_in_emit_context():
+    buffer = ShardedRecordBuffer(shards=1)
+    contexts = []
+
+    consumer = RecordConsumer(
+        buffer=buffer,
+        dispatch=lambda record: contexts.append(get_context()),
+        poll_interval=60,
+    )
+
+    token = bind_context(request_id='abc')
+    buffer.append(make_record('message', created=1))
+    reset_context(token)
+
+    buffer.append(make_record('message', created=2))
+
+    consumer.drain()
+
+    assert contexts == [{'request_id': 'abc'}, {}]
+
+
+def test_consumer_drains_on_shutdown():
+    buffer = ShardedRecordBuffer(shards=1)
+    dispatch = mock.Mock()
+
+    consumer = RecordConsumer(buffer=buffer, dispatch=dispatch,
+                              poll_interval=60)
+    consumer.start()
+
+    buffer.append(make_record('message', created=1))
+    consumer.shutdown(timeout=5)
+
+    assert not consumer.is_alive()
+    dispatch.assert_called_once()
@@ -1,6 +1,13 @@
+import json
+import logging
+import threading
+import time
+from unittest import mock
+
 import pytest
 
 import http_logging
+from http_logging.dispatcher import HttpDispatcher
 from http_logging.formatter import HttpLogFormatter
 from http_logging.handler import AsyncHttpHandler
 from http_logging.transport import AsyncHttpTransport
@@ -40,3 +47,317 @@ def test_custom_formatter_and_transport(http_host):
 
     assert handler._transport == transport
     assert handler.formatter == formatter
+
+
+def test_shared_cache_path(tmp_path):
+    config = http_logging.ConfigLog(database_path=str(tmp_path / 'cache.db'))
+
+    audit, audit_replica = [
+        AsyncHttpHandler(
+            http_host=http_logging.HttpHost(name='audit.example.com'),
+            config=config,
+        )
+        for _ in range(2)
+    ]
+
+    # Would ship the events of each other to the wrong collector
+    with pytest.raises(ValueError, match='audit.example.com'):
+        AsyncHttpHandler(
+            http_host=http_logging.HttpHost(name='errors.example.com'),
+            config=config,
+        )
+
+    with pytest.raises(ValueError):
+        HttpDispatcher(config=config)
+
+    audit.close()
+    audit_replica.close()
+
+    AsyncHttpHandler(
+        http_host=http_logging.HttpHost(name='errors.example.com'),
+        config=config,
+    ).close()
+
+
+def test_worker_per_handler():
+    handlers = [
+        AsyncHttpHandler(
+            http_host=http_logging.HttpHost(name='dummy-host.com'),
+            config=http_logging.ConfigLog(
+                database_path=None,
+                queued_events_batch_size=batch_size,
+            ),
+        )
+        for batch_size in (5, 500)
+    ]
+
+    try:
+        for handler in handlers:
+            handler._start_worker_thread()
+
+        audit_worker, error_worker = [h._worker_thread for h in handlers]
+
+        assert audit_worker is not error_worker
+        assert audit_worker.config.queued_events_batch_size == 5
+        assert error_worker.config.queued_events_batch_size == 500
+    finally:
+        for handler in handlers:
+            handler.close()
+
+    assert all(h._worker_thread is None for h in handlers)
+
+
+def test_priority_level(http_host):
+    config = http_logging.ConfigLog(priority_level=logging.ERROR)
+    handler = AsyncHttpHandler(http_host=http_host, config=config)
+    handler._worker_thread = mock.Mock()
+    handler._worker_thread_is_running = mock.Mock(return_value=True)
+
+    logger = logging.getLogger('test_priority_level')
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    logger.addHandler(handler)
+
+    logger.info('Regular')
+    handler._worker_thread.enqueue_event.assert_called_once()
+    handler._worker_thread.enqueue_priority_event.assert_not_called()
+
+    logger.critical('Priority')
+    handler._worker_thread.enqueue_priority_event.assert_called_once()
+    handler._worker_thread.enqueue_event.assert_called_once()
+
+    logger.removeHandler(handler)
+
+
+@pytest.fixture
+def get_drain_handler(http_host, tmp_path):
+    logger = logging.getLogger('test_drain')
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+
+    handlers = []
+
+    def build(send=None):
+        transport = mock.NonCallableMock(spec=AsyncHttpTransport)
+        transport.send.side_effect = send
+
+        config = http_logging.ConfigLog(
+            database_path=str(tmp_path / f'cache-{len(handlers)}.db'),
+            queued_events_flush_interval=3600,
+            queued_events_flush_count=1000,
+            queued_events_batch_size=10,
+        )
+
+        handler = AsyncHttpHandler(
+            http_host=http_host,
+            config=config,
+            transport_class=transport,
+        )
+        handlers.append(handler)
+
+        logger.addHandler(handler)
+
+        for i in range(25):
+            logger.info('Event %s', i)
+
+        logger.removeHandler(handler)
+
+        return handler, transport
+
+    yield build
+
+    for handler in handlers:
+        handler.close(drain_timeout=0)
+
+
+def test_flush_with_timeout(get_drain_handler):
+    handler, transport = get_drain_handler()
+
+    result = handler.flush(timeout=5)
+
+    assert result == http_logging.FlushResult(shipped=25, deferred=0)
+    assert transport.send.call_count == 3
+
+
+def test_flush_with_timeout_collector_down(get_drain_handler):
+    def send(events, **kwargs):
+        raise ConnectionError('Collector down')
+
+    handler, transport = get_drain_handler(send=send)
+
+    result = handler.flush(timeout=5)
+
+    assert result == http_logging.FlushResult(shipped=0, deferred=25)
+
+
+def test_flush_with_timeout_is_bounded(get_drain_handler):
+    handler, transport = get_drain_handler(send=lambda *a, **k: time.sleep(3))
+
+    start = time.monotonic()
+    result = handler.flush(timeout=0.2)
+
+    assert time.monotonic() - start < 1.5
+    assert result == http_logging.FlushResult(shipped=0, deferred=25)
+
+
+def test_close_with_drain_timeout(get_drain_handler):
+    handler, transport = get_drain_handler()
+
+    result = handler.close(drain_timeout=5)
+
+    assert result == http_logging.FlushResult(shipped=25, deferred=0)
+    assert handler._worker_thread is None
+
+
+def test_frontend_mode(http_host):
+    config = http_logging.ConfigLog(frontend_shards=4)
+    handler = AsyncHttpHandler(http_host=http_host, config=config)
+    handler._worker_thread = mock.Mock()
+    handler._worker_thread_is_running = mock.Mock(return_value=True)
+    handler.acquire = mock.Mock()
+
+    logger = logging.getLogger('test_frontend_mode')
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    logger.addHandler(handler)
+
+    with http_logging.log_context(request_id='abc'):
+        logger.info('Deferred %s', 'formatting')
+
+    logger.removeHandler(handler)
+
+    # Formatted by the consumer, with the context of the emitting thread
+    handler.flush()
+    handler._stop_record_consumer()
+
+    handler.acquire.assert_not_called()
+    event = json.loads(handler._worker_thread.enqueue_event.call_args.args[0])
+
+    assert event['message'] == 'Deferred formatting'
+    assert event['context'] == {'request_id': 'abc'}
+
+
+def test_rollups(http_host):
+    transport = mock.NonCallableMock(spec=AsyncHttpTransport)
+    config = http_logging.ConfigLog(
+        database_path=None,
+        rollups=[http_logging.HttpRollup(
+            name='request_time',
+            value_field='duration_ms',
+            msg_template='Request handled in %s ms',
+        )],
+    )
+    handler = AsyncHttpHandler(
+        http_host=http_host,
+        config=config,
+        transport_class=transport,
+    )
+
+    logger = logging.getLogger('test_rollups')
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    logger.addHandler(handler)
+
+    for duration in range(100):
+        logger.info('Request handled in %s ms', duration,
+                    extra={'duration_ms': duration})
+    logger.info('Not a request')
+
+    logger.removeHandler(handler)
+    handler.close()
+
+    events = [
+        json.loads(event)
+        for call in transport.send.call_args_list
+        for event in call.args[0]
+    ]
+
+    rollups = [event for event in events if 'extra' in event]
+    messages = [event['message'] for event in events if 'extra' not in event]
+
+    # The window in progress is shipped on close (two if the records fell
+    # on both sides of a window boundary)
+    assert messages == ['Not a request']
+    assert 1 <= len(rollups) <= 2
+    assert sum(e['extra']['rollup']['count'] for e in rollups) == 100
+    assert sum(e['extra']['rollup']['sum'] for e in rollups) == \
+        sum(range(100))
+
+
+def test_rollups_close_under_handler_lock(http_host):
+    transport = mock.NonCallableMock(spec=AsyncHttpTransport)
+    handler = AsyncHttpHandler(
+        http_host=http_host,
+        config=http_logging.ConfigLog(
+            database_path=None,
+            rollups=[http_logging.HttpRollup(
+                name='request_time', value_field='duration_ms')],
+        ),
+        transport_class=transport,
+    )
+    record = logging.makeLogRecord({'msg': 'Handled', 'duration_ms': 5})
+    handler.emit(record)
+
+    # As `logging.shutdown` does, while the flusher ships a window
+    handler.acquire()
+    try:
+        shipping = threading.Thread(
+            target=handler._ship_rollups,
+            args=(handler._rollups.collect(force=True),),
+        )
+        shipping.start()
+        shipping.join(timeout=5)
+
+        assert not shipping.is_alive()
+
+        handler.emit(record)
+        handler.close()
+    finally:
+        handler.release()
+
+    events = [
+        json.loads(event)
+        for call in transport.send.call_args_list
+        for event in call.args[0]
+    ]
+
+    assert [e['extra']['rollup']['count'] for e in events] == [1, 1]
+
+
+@mock.patch('http_logging.transport.requests')
+def test_pipelined_handler(mock_requests, http_host):
+    mock_post = mock_requests.Session().post
+    mock_post.return_value.ok = True
+
+    handler = AsyncHttpHandler(
+        http_host=http_host,
+        config=http_logging.ConfigLog(
+            database_path=None,
+            queued_events_batch_size=100,
+            queued_events_flush_count=1000,
+            queued_events_flush_interval=3600,
+            max_request_size=1000,
+            pipeline_buffers=2,
+        ),
+    )
+
+    with mock.patch.object(
+        AsyncHttpTransport, 'iter_prepared_batches',
+        autospec=True,
+        side_effect=AsyncHttpTransport.iter_prepared_batches,
+    ) as iter_prepared_batches:
+        for i in range(50):
+            handler.emit(logging.makeLogRecord({'msg': f'event-{i}'}))
+
+        handler.close(drain_timeout=5)
+
+    messages = [
+        event['message']
+        for call in mock_post.mock_calls
+        for event in json.loads(call.kwargs['data'])
+    ]
+
+    # One send of the worker, split in requests prepared ahead
+    iter_prepared_batches.assert_called_once()
+    assert mock_post.call_count > 2
+    assert messages == [f'event-{i}' for i in range(50)]
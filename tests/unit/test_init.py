@@ -0,0 +1,50 @@
+import subprocess
+import sys
+
+import pytest
+
+import http_logging
+
+
+LAZY_MODULES = (
+    'requests',
+    'logstash_async.transport',
+    'http_logging.transport',
+    'http_logging.dispatcher',
+    'http_logging.formatter',
+    'http_logging.handler',
+)
+
+
+def test_import_is_lazy():
+    statement = '; '.join([
+        'import sys',
+        'import http_logging',
+        f'print(",".join(m for m in {LAZY_MODULES!r} if m in sys.modules))',
+    ])
+
+    process = subprocess.run(
+        [sys.executable, '-c', statement],
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+
+    assert process.stdout.strip() == ''
+
+
+def test_lazy_attributes():
+    from http_logging.dispatcher import HttpDispatcher
+    from http_logging.formatter import HttpLogFormatter
+    from http_logging.handler import AsyncHttpHandler
+    from http_logging.transport import AsyncHttpTransport
+
+    assert http_logging.AsyncHttpHandler is AsyncHttpHandler
+    assert http_logging.AsyncHttpTransport is AsyncHttpTransport
+    assert http_logging.HttpDispatcher is HttpDispatcher
+    assert http_logging.HttpLogFormatter is HttpLogFormatter
+
+    assert 'AsyncHttpHandler' in dir(http_logging)
+
+    with pytest.raises(AttributeError):
+        http_logging.DoesNotExist
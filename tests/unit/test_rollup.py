@@ -0,0 +1,89 @@
+import logging
+
+import pytest
+
+import http_logging
+from http_logging.rollup import RollupAggregator, RollupRecord
+
+
+@pytest.fixture
+def request_rollup():
+    return http_logging.HttpRollup(
+        name='request_time',
+        value_field='duration_ms',
+        logger='app.web',
+        level=logging.INFO,
+        msg_template='Request handled in %s ms',
+        window=10.0,
+        buckets=[10, 100],
+    )
+
+
+def build_record(
+    duration=None,
+    created=1000.0,
+    name='app.web.views',
+    level=logging.INFO,
+    msg='Request handled in %s ms',
+):
+    record = logging.makeLogRecord({
+        'name': name,
+        'levelno': level,
+        'levelname': logging.getLevelName(level),
+        'msg': msg,
+        'args': (duration,),
+        'created': created,
+    })
+
+    if duration is not None:
+        record.duration_ms = duration
+
+    return record
+
+
+def test_rollup_matching(request_rollup):
+    assert request_rollup.matches(build_record())
+    assert request_rollup.matches(build_record(name='app.web'))
+    assert not request_rollup.matches(build_record(name='app.webhooks'))
+    assert not request_rollup.matches(build_record(level=logging.WARNING))
+    assert not request_rollup.matches(build_record(msg='Request failed'))
+
+    with pytest.raises(ValueError):
+        http_logging.HttpRollup(name='x', value_field='x', window=0)
+
+
+def test_rollup_windows(request_rollup):
+    aggregator = RollupAggregator(rollups=[request_rollup])
+
+    for duration, created in ((5, 1000.0), (50, 1001.0), (500, 1009.9),
+                              (20, 1010.0)):
+        assert aggregator.add(build_record(duration, created=created))
+
+    # Records without a numeric value and rollup events are not folded
+    assert not aggregator.add(build_record('slow'))
+    assert not aggregator.add(build_record())
+    assert not aggregator.add(RollupRecord(
+        'app.web', logging.INFO, __file__, 0, 'Request handled in %s ms',
+        (), None))
+
+    # The second window is not over yet
+    records = aggregator.collect(now=1015.0)
+
+    assert len(records) == 1
+    assert records[0].getMessage() == 'Rollup request_time: 3 events'
+    assert records[0].rollup == {
+        'name': 'request_time',
+        'field': 'duration_ms',
+        'msg_template': 'Request handled in %s ms',
+        'window_start': 1000.0,
+        'window_end': 1010.0,
+        'count': 3,
+        'sum': 555.0,
+        'min': 5,
+        'max': 500,
+        'mean': 185.0,
+        'histogram': {'buckets': [10, 100], 'counts': [1, 1, 1]},
+    }
+
+    assert aggregator.collect(now=1015.0) == []
+    assert [r.rollup['count'] for r in aggregator.collect(force=True)] == [1]
@@ -1,3 +1,4 @@
+import json
 from unittest import mock
 
 import pytest
@@ -204,3 +205,239 @@ def test_send_failed_request(
     mock_response.raise_for_status.assert_called()
     mock_logger.debug.assert_called()
     mock_logger.exception.assert_called_with(req_exception)
+
+
+@mock.patch('http_logging.transport.logger')
+@mock.patch('http_logging.transport.requests')
+def test_send_failed_request_raise_errors(
+    mock_requests,
+    mock_logger,
+    get_http_host,
+):
+    transport = AsyncHttpTransport(http_host=get_http_host())
+
+    req_exception = requests.exceptions.RequestException('HTTP Error')
+    mock_requests.Session().post.side_effect = req_exception
+
+    transport._AsyncHttpTransport__batches = mock.Mock(
+        return_value=[[{'foo': 'bar'}]])
+
+    with pytest.raises(requests.exceptions.RequestException):
+        transport.send(events=mock.Mock(), raise_errors=True)
+
+    mock_requests.Session().close.assert_called()
+
+
+@mock.patch('http_logging.transport.requests')
+def test_send_to_host_group(mock_requests):
+    group = http_logging.HttpHostGroup(
+        hosts=[
+            http_logging.HttpHost(name='primary.com', path='logs'),
+            http_logging.HttpHost(name='secondary.com', path='logs'),
+        ],
+        strategy='failover',
+        mirror=http_logging.HttpHost(name='archive.com'),
+    )
+
+    def post(url, **kwargs):
+        if 'primary' in url:
+            raise requests.exceptions.ConnectionError('Replica down')
+        return mock.Mock(ok=True)
+
+    mock_requests.Session().post.side_effect = post
+
+    transport = AsyncHttpTransport(http_host=group)
+    transport._AsyncHttpTransport__batches = mock.Mock(
+        return_value=[[{'foo': 'bar'}]])
+
+    transport.send(events=mock.Mock(), raise_errors=True)
+
+    posted_urls = [
+        call.args[0] for call in mock_requests.Session().post.mock_calls
+    ]
+
+    assert posted_urls == [
+        'https://primary.com/logs',
+        'https://secondary.com/logs',
+        'https://archive.com',
+    ]
+    assert transport._endpoints.endpoints[0].failures == 1
+
+
+def test_custom_headers_ttl(get_http_host):
+    mock_custom_headers = mock.Mock(return_value={'Authorization': 'token'})
+    config = http_logging.ConfigLog(
+        custom_headers=mock_custom_headers,
+        custom_headers_ttl=60,
+    )
+
+    transport = AsyncHttpTransport(http_host=get_http_host(), config=config)
+
+    for _ in range(3):
+        assert transport.headers == {
+            'Content-Type': 'application/json',
+            'Authorization': 'token',
+        }
+
+    assert mock_custom_headers.call_count == 1
+
+    transport._headers_expire_at = 0.0
+    transport.headers
+
+    assert mock_custom_headers.call_count == 2
+
+
+def test_request_template_is_cached(get_http_host):
+    transport = AsyncHttpTransport(http_host=get_http_host())
+
+    assert transport.url is transport.url
+    assert transport.logger is transport.logger
+
+
+@mock.patch('http_logging.transport.Http2Session')
+@mock.patch('http_logging.transport.requests')
+def test_http2_session_is_shared(mock_requests, mock_session, get_http_host):
+    config = http_logging.ConfigLog(http2=True, http2_max_streams=8)
+    transport = AsyncHttpTransport(http_host=get_http_host(), config=config)
+
+    for _ in range(3):
+        transport.send(['{"message": "hello"}'], raise_errors=True)
+
+    mock_session.assert_called_once_with(
+        ssl_verify=True,
+        certfile=None,
+        keyfile=None,
+        max_streams=8,
+    )
+    assert mock_session().post.call_count == 3
+    mock_requests.Session.assert_not_called()
+
+    transport.close()
+
+    mock_session().shutdown.assert_called_once()
+    assert transport._http2_session is None
+
+
+@mock.patch('http_logging.transport.Http2Session')
+@mock.patch('http_logging.transport.requests')
+def test_http2_fallback(mock_requests, mock_session, get_http_host):
+    mock_session.side_effect = ImportError('No module named httpx')
+
+    config = http_logging.ConfigLog(http2=True)
+    transport = AsyncHttpTransport(http_host=get_http_host(), config=config)
+
+    for _ in range(2):
+        transport.send(['{"message": "hello"}'], raise_errors=True)
+
+    mock_session.assert_called_once()
+    assert mock_requests.Session().post.call_count == 2
+
+
+def test_http2_session_multiplexing():
+    httpx = pytest.importorskip('httpx')
+    pytest.importorskip('h2')
+
+    from http_logging.http2 import Http2Session
+
+    requests_seen = []
+
+    def respond(request):
+        requests_seen.append(json.loads(request.content))
+        return httpx.Response(200 if len(requests_seen) == 1 else 503)
+
+    session = Http2Session(max_streams=2)
+    session._client = httpx.Client(transport=httpx.MockTransport(respond))
+
+    response = session.post('https://collector.com', {}, json=[{'a': 1}])
+    assert response.ok
+
+    response = session.post('https://collector.com', {}, json=[{'a': 2}])
+    assert not response.ok and response.status_code == 503
+
+    with pytest.raises(requests.exceptions.HTTPError) as error:
+        response.raise_for_status()
+
+    assert error.value.response.status_code == 503
+    assert requests_seen == [[{'a': 1}], [{'a': 2}]]
+    session.shutdown()
+
+
+def test_http2_network_errors():
+    httpx = pytest.importorskip('httpx')
+    pytest.importorskip('h2')
+
+    from logstash_async.worker import NETWORK_EXCEPTIONS
+
+    from http_logging.http2 import Http2Session
+
+    def fail(request):
+        raise errors.pop(0)
+
+    errors = [
+        httpx.ConnectError('Connection refused'),
+        httpx.ReadTimeout('Timed out'),
+    ]
+    session = Http2Session()
+    session._client = httpx.Client(transport=httpx.MockTransport(fail))
+
+    # Logged as warnings by the worker, like `requests` errors
+    for expected in (requests.exceptions.ConnectionError,
+                     requests.exceptions.Timeout):
+        with pytest.raises(expected) as error:
+            session.post('https://collector.com', {}, json=[])
+
+        assert isinstance(error.value, NETWORK_EXCEPTIONS)
+
+    session.shutdown()
+
+
+@mock.patch('http_logging.transport.requests')
+def test_pipelined_send(mock_requests, get_http_host):
+    mock_post = mock_requests.Session().post
+    mock_post.return_value.ok = True
+
+    events = [json.dumps({'message': f'event-{i}'}) for i in range(50)]
+
+    def send(config):
+        transport = AsyncHttpTransport(http_host=get_http_host(),
+                                       config=config)
+        transport._max_content_length = 200
+
+        mock_post.reset_mock()
+        transport.send(events, raise_errors=True)
+        transport.close()
+
+        return [
+            json.loads(call.kwargs['data']) if 'data' in call.kwargs
+            else call.kwargs['json']
+            for call in mock_post.mock_calls
+        ]
+
+    sequential = send(http_logging.ConfigLog())
+    pipelined = send(http_logging.ConfigLog(pipeline_buffers=2))
+
+    # Same batches, in the same order, encoded ahead of sending
+    assert len(sequential) > 2
+    assert pipelined == sequential
+    assert all('data' in call.kwargs for call in mock_post.mock_calls)
+
+
+@mock.patch('http_logging.transport.requests')
+def test_pipelined_send_failure(mock_requests, get_http_host):
+    mock_post = mock_requests.Session().post
+    mock_post.side_effect = requests.exceptions.ConnectionError('Down')
+
+    config = http_logging.ConfigLog(pipeline_buffers=1, pipeline_workers=1)
+    transport = AsyncHttpTransport(http_host=get_http_host(), config=config)
+    transport._max_content_length = 100
+
+    events = [json.dumps({'message': f'event-{i}'}) for i in range(50)]
+
+    # Preparation stops with the first failed batch, freeing the pool
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            transport.send(events, raise_errors=True)
+
+    assert mock_post.call_count == 2
+
+    transport.close()
@@ -0,0 +1,536 @@
+from datetime import datetime, timedelta, timezone
+import sqlite3
+import time
+from unittest import mock
+
+import pytest
+from logstash_async.database import DatabaseDiskIOError, DatabaseLockedError
+
+import http_logging
+from http_logging.cache import HttpDatabaseCache, HttpMemoryCache
+from http_logging.worker import AsyncHttpWorker
+
+
+def build_worker(config, database_path=None):
+    return AsyncHttpWorker(
+        host='dummy-host.com',
+        port=None,
+        transport=mock.Mock(),
+        ssl_enable=True,
+        ssl_verify=True,
+        keyfile=None,
+        certfile=None,
+        ca_certs=None,
+        database_path=database_path,
+        cache={},
+        event_ttl=None,
+        config=config,
+    )
+
+
+@pytest.fixture
+def audit_config():
+    return http_logging.ConfigLog(
+        queue_check_interval=0.1,
+        queued_events_flush_interval=0.5,
+        queued_events_flush_count=500,
+        queued_events_batch_size=200,
+    )
+
+
+@pytest.fixture
+def error_config():
+    return http_logging.ConfigLog(
+        queue_check_interval=2.0,
+        queued_events_flush_interval=30.0,
+        queued_events_flush_count=1,
+        queued_events_batch_size=5,
+    )
+
+
+def test_independent_flush_settings(audit_config, error_config):
+    audit_worker = build_worker(config=audit_config)
+    error_worker = build_worker(config=error_config)
+
+    for worker in (audit_worker, error_worker):
+        worker._last_event_flush_date = datetime.now() - timedelta(seconds=1)
+        worker._non_flushed_event_count = 2
+
+    assert audit_worker._queued_event_interval_reached() is True
+    assert error_worker._queued_event_interval_reached() is False
+
+    assert audit_worker._queued_event_count_reached() is False
+    assert error_worker._queued_event_count_reached() is True
+
+
+def test_timezone_aware_flush_date(audit_config):
+    worker = build_worker(config=audit_config)
+
+    # As stored by python-logstash-async 4+
+    worker._last_event_flush_date = \
+        datetime.now(tz=timezone.utc) - timedelta(seconds=1)
+
+    assert worker._queued_event_interval_reached() is True
+
+    # Whichever version is installed
+    worker._reset_flush_counters()
+
+    assert worker._queued_event_interval_reached() is False
+
+
+def test_delay_processing(audit_config):
+    worker = build_worker(config=audit_config)
+    worker._wakeup_event = mock.Mock()
+
+    worker._delay_processing()
+
+    worker._wakeup_event.wait.assert_called_with(0.1)
+
+
+def test_memory_cache_batch_size(error_config):
+    worker = build_worker(config=error_config)
+    worker._setup_database()
+
+    assert isinstance(worker._database, HttpMemoryCache)
+
+    for i in range(12):
+        worker._database.add_event(f'event-{i}')
+
+    assert len(worker._database.get_queued_events()) == 5
+    assert worker._database.get_non_flushed_event_count() == 7
+
+
+def test_database_cache_batch_size(error_config, tmp_path):
+    database_path = str(tmp_path / 'cache.db')
+    worker = build_worker(config=error_config, database_path=database_path)
+    worker._setup_database()
+
+    assert isinstance(worker._database, HttpDatabaseCache)
+
+    for i in range(12):
+        worker._database.add_event(f'event-{i}')
+
+    assert len(worker._database.get_queued_events()) == 5
+    assert worker._database.get_non_flushed_event_count() == 7
+
+
+def test_priority_events_sent_ahead_of_backlog(audit_config):
+    worker = build_worker(config=audit_config)
+    worker._setup_logger()
+    worker._setup_database()
+
+    worker._database.add_event('bulk-event')
+    worker.enqueue_priority_event('priority-event')
+
+    queued_events = worker._fetch_queued_events_for_flush()
+
+    worker._transport.send.assert_called_once_with(
+        ['priority-event'],
+        use_logging=True,
+    )
+    assert [e['event_text'] for e in queued_events] == ['bulk-event']
+
+
+def test_priority_flush_delay(audit_config):
+    audit_config.priority_flush_delay = 60.0
+    worker = build_worker(config=audit_config)
+
+    worker.enqueue_priority_event('priority-event')
+    worker._flush_priority_events()
+
+    worker._transport.send.assert_not_called()
+    assert 0 < worker._priority_flush_wait() <= 60.0
+
+    worker._flush_priority_events(force=True)
+
+    worker._transport.send.assert_called_once()
+    assert len(worker._priority_queue) == 0
+
+
+def test_priority_events_fall_back_to_cache(audit_config):
+    worker = build_worker(config=audit_config)
+    worker._setup_logger()
+    worker._transport.send.side_effect = ConnectionError('Collector down')
+
+    worker.enqueue_priority_event('priority-event')
+    worker._flush_priority_events()
+
+    assert len(worker._priority_queue) == 0
+    assert worker._queue.get(block=False) == 'priority-event'
+
+
+def test_priority_lane_backoff(audit_config):
+    worker = build_worker(config=audit_config)
+    worker._setup_logger()
+    worker._setup_database()
+    worker._transport.send.side_effect = ConnectionError('Collector down')
+
+    worker.enqueue_priority_event('first')
+    worker._flush_priority_events()
+
+    # Later bursts go through the cache until a regular flush succeeds
+    worker.enqueue_priority_event('second')
+    worker._flush_priority_events()
+
+    assert worker._transport.send.call_count == 1
+    assert [worker._queue.get(block=False) for _ in range(2)] == \
+        ['first', 'second']
+
+    worker._transport.send.side_effect = None
+    worker._database.add_event('regular')
+    worker._flush_queued_events(force=True)
+
+    worker.enqueue_priority_event('third')
+    worker._flush_priority_events()
+
+    worker._transport.send.assert_called_with(['third'], use_logging=True)
+
+
+def test_backlog_drain(audit_config, tmp_path):
+    audit_config.backlog_threshold = 100
+    audit_config.backlog_chunk_size = 400
+
+    worker = build_worker(
+        config=audit_config,
+        database_path=str(tmp_path / 'cache.db'),
+    )
+    worker._setup_logger()
+    worker._setup_database()
+
+    for i in range(1000):
+        worker._database.add_event(f'event-{i}')
+    worker._non_flushed_event_count = 1000
+
+    worker._flush_queued_events(force=True)
+
+    chunks = [c.args[0] for c in worker._transport.send.mock_calls]
+
+    assert [len(chunk) for chunk in chunks] == [400, 400, 200]
+    assert chunks[0][0] == 'event-0' and chunks[-1][-1] == 'event-999'
+    assert worker._database.get_non_flushed_event_count() == 0
+    assert worker._draining_backlog is False
+
+
+def test_backlog_drain_yields_to_drain_requests(audit_config, tmp_path):
+    audit_config.backlog_threshold = 100
+    audit_config.backlog_chunk_size = 250
+
+    worker = build_worker(
+        config=audit_config,
+        database_path=str(tmp_path / 'cache.db'),
+    )
+    worker._setup_logger()
+    worker._setup_database()
+
+    for i in range(1000):
+        worker._database.add_event(f'event-{i}')
+    worker._non_flushed_event_count = 1000
+
+    # Requested by `flush(timeout)` while the first chunk is in flight
+    worker._transport.send.side_effect = \
+        lambda *args, **kwargs: worker.request_drain(timeout=0.5)
+
+    worker._flush_queued_events(force=True)
+
+    # Left for the drain request, not shipped in regular batches
+    assert [len(c.args[0]) for c in worker._transport.send.mock_calls] == \
+        [250]
+    assert worker._database.get_non_flushed_event_count() == 750
+    assert len(worker._drain_requests) == 1
+
+
+def test_backlog_drain_keeps_requeued_events(audit_config, tmp_path):
+    audit_config.backlog_threshold = 1
+
+    database_path = str(tmp_path / 'cache.db')
+    worker = build_worker(config=audit_config, database_path=database_path)
+    worker._setup_logger()
+    worker._setup_database()
+
+    for i in range(10):
+        worker._database.add_event(f'event-{i}')
+    worker._non_flushed_event_count = 10
+
+    # In flight in another process sharing the cache, which fails to ship
+    # them while the backlog chunk is sent
+    def set_in_flight(pending_delete):
+        with sqlite3.connect(database_path) as connection:
+            connection.execute(
+                'UPDATE `event` SET `pending_delete` = ? '
+                'WHERE `event_id` BETWEEN 4 AND 6;', (pending_delete,))
+        connection.close()
+
+    set_in_flight(1)
+    worker._transport.send.side_effect = lambda *args, **kwargs: \
+        set_in_flight(0)
+
+    worker._flush_queued_events(force=True)
+
+    # Shipped after the backlog, instead of deleted with its chunk
+    sent = [c.args[0] for c in worker._transport.send.mock_calls]
+
+    assert sent[0] == [f'event-{i}' for i in (0, 1, 2, 6, 7, 8, 9)]
+    assert sent[1] == ['event-3', 'event-4', 'event-5']
+
+
+def test_backlog_drain_failure_keeps_events(audit_config, tmp_path):
+    audit_config.backlog_threshold = 100
+
+    worker = build_worker(
+        config=audit_config,
+        database_path=str(tmp_path / 'cache.db'),
+    )
+    worker._setup_logger()
+    worker._setup_database()
+    worker._transport.send.side_effect = ConnectionError('Collector down')
+
+    for i in range(150):
+        worker._database.add_event(f'event-{i}')
+    worker._non_flushed_event_count = 150
+
+    worker._flush_queued_events(force=True)
+
+    assert worker._transport.send.call_count == 1
+    assert worker._database.get_non_flushed_event_count() == 150
+
+
+def test_backlog_rate_limit(audit_config):
+    audit_config.backlog_rate_limit = 100
+    worker = build_worker(config=audit_config)
+    worker._shutdown_event = mock.Mock()
+
+    worker._throttle_backlog(shipped=50, started_at=time.monotonic())
+
+    delay = worker._shutdown_event.wait.call_args.args[0]
+    assert 0.4 < delay <= 0.5
+
+
+def build_maintenance_worker(config, database_path):
+    config.maintenance_chunk_size = 100
+
+    worker = build_worker(config=config, database_path=database_path)
+    worker._event_ttl = 3600
+    worker._setup_logger()
+    worker._setup_database()
+
+    for i in range(500):
+        worker._database.add_event('x' * 1000)
+
+    with sqlite3.connect(database_path) as connection:
+        connection.execute(
+            "UPDATE `event` SET `entry_date` = datetime('now', '-2 hours') "
+            "WHERE `event_id` <= 400;")
+
+    worker._maintenance_due_at = 0.0
+
+    return worker
+
+
+def test_cache_maintenance(audit_config, tmp_path):
+    worker = build_maintenance_worker(
+        config=audit_config,
+        database_path=str(tmp_path / 'cache.db'),
+    )
+    size = worker._database.get_size()
+
+    worker._run_maintenance()
+
+    report = worker.last_maintenance_report
+
+    assert report.expired == 400
+    assert report.reclaimed > 0
+    assert report.size == size - report.reclaimed
+    assert worker._database.get_non_flushed_event_count() == 100
+    assert worker._non_flushed_event_count == 100
+    assert worker._maintenance_due_at > time.monotonic() + 3000
+
+
+def test_cache_maintenance_yields_to_events(audit_config, tmp_path):
+    worker = build_maintenance_worker(
+        config=audit_config,
+        database_path=str(tmp_path / 'cache.db'),
+    )
+    worker._queue.put('event')
+
+    worker._run_maintenance()
+
+    assert worker.last_maintenance_report is None
+    assert worker._database.get_non_flushed_event_count() == 500
+
+    worker._queue.get()
+    worker._run_maintenance()
+
+    assert worker.last_maintenance_report.expired == 400
+
+
+def test_cache_vacuum_conversion(tmp_path):
+    path = str(tmp_path / 'cache.db')
+
+    # Created by an earlier version, without incremental auto-vacuum
+    with sqlite3.connect(path) as connection:
+        connection.execute(
+            'CREATE TABLE `event` (`event_id` INTEGER NOT NULL PRIMARY KEY '
+            'AUTOINCREMENT, `event_text` TEXT NOT NULL, `pending_delete` '
+            'INTEGER NOT NULL, `entry_date` DATETIME NOT NULL);')
+    connection.close()
+
+    cache = HttpDatabaseCache(path=path)
+
+    assert cache.incremental_vacuum(pages=100) == 0
+
+    with sqlite3.connect(path) as connection:
+        assert connection.execute('PRAGMA auto_vacuum;').fetchone()[0] == 2
+    connection.close()
+
+
+def test_expiry_between_maintenance_runs(audit_config, tmp_path):
+    worker = build_maintenance_worker(
+        config=audit_config,
+        database_path=str(tmp_path / 'cache.db'),
+    )
+    worker._maintenance_due_at = time.monotonic() + 3600
+
+    # Expired on every idle check, not only by maintenance runs
+    worker._expire_events()
+
+    assert worker.last_maintenance_report is None
+    assert worker._database.get_non_flushed_event_count() == 100
+
+
+def test_cache_maintenance_yields_to_backlog(audit_config, tmp_path):
+    audit_config.backlog_threshold = 500
+    worker = build_maintenance_worker(
+        config=audit_config,
+        database_path=str(tmp_path / 'cache.db'),
+    )
+    worker._non_flushed_event_count = 500
+
+    worker._run_maintenance()
+
+    assert worker.last_maintenance_report is None
+
+
+@pytest.fixture
+def event_driven_worker():
+    workers = []
+
+    def build(**config_args):
+        config = http_logging.ConfigLog(maintenance_interval=None,
+                                        **config_args)
+        worker = build_worker(config=config)
+        worker.start()
+        workers.append(worker)
+        return worker
+
+    yield build
+
+    for worker in workers:
+        worker.shutdown()
+        worker.join(timeout=5)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_event_driven_max_delay(event_driven_worker):
+    worker = event_driven_worker(flush_max_delay=0.2)
+
+    for i in range(3):
+        worker.enqueue_event(f'event-{i}'.encode())
+
+    assert wait_for(lambda: worker._transport.send.called)
+
+    worker._transport.send.assert_called_once()
+    assert worker._transport.send.call_args.args[0] == \
+        [b'event-0', b'event-1', b'event-2']
+
+    # Nothing left to do: sleep until the next event
+    assert wait_for(lambda: worker._next_wakeup() is None)
+
+
+def test_event_driven_max_bytes(event_driven_worker):
+    worker = event_driven_worker(flush_max_delay=60, flush_max_bytes=100)
+
+    worker.enqueue_event(b'x' * 60)
+    time.sleep(0.1)
+    worker._transport.send.assert_not_called()
+
+    worker.enqueue_event(b'y' * 60)
+
+    assert wait_for(lambda: worker._transport.send.called, timeout=1.0)
+
+
+def test_event_driven_retry_delay(audit_config):
+    audit_config.flush_max_delay = 0.0
+    audit_config.maintenance_interval = None
+
+    worker = build_worker(config=audit_config)
+    worker._setup_logger()
+    worker._setup_database()
+    worker._reset_flush_counters()
+    worker._transport.send.side_effect = ConnectionError('Collector down')
+
+    worker._event = b'event'
+    worker._write_event_to_database()
+    worker._flush_queued_events()
+
+    assert worker._transport.send.call_count == 1
+    assert worker._pending_bytes == 0
+    assert 0.4 < worker._next_wakeup() <= 0.5  # queued_events_flush_interval
+
+    worker._flush_queued_events()
+    assert worker._transport.send.call_count == 1
+
+
+def test_event_driven_cache_error(event_driven_worker):
+    get_queued_events = HttpMemoryCache.get_queued_events
+    errors = [DatabaseDiskIOError('Disk full')]
+
+    def fail_once(cache):
+        if errors:
+            raise errors.pop()
+        return get_queued_events(cache)
+
+    with mock.patch.object(HttpMemoryCache, 'get_queued_events', fail_once):
+        worker = event_driven_worker(
+            flush_max_delay=0.0, queued_events_flush_interval=0.2)
+
+        for i in range(3):
+            worker.enqueue_event(f'event-{i}'.encode())
+            time.sleep(0.05)
+
+        # Retried after queued_events_flush_interval, nothing requeued
+        assert wait_for(lambda: not errors and sorted(
+            event
+            for call in worker._transport.send.call_args_list
+            for event in call.args[0]
+        ) == [b'event-0', b'event-1', b'event-2'])
+
+    assert worker.is_alive()
+    assert worker._queue.empty()
+
+
+def test_event_driven_locked_cache(audit_config):
+    audit_config.flush_max_delay = 0.0
+    audit_config.maintenance_interval = None
+
+    worker = build_worker(config=audit_config)
+    worker._setup_logger()
+    worker._setup_database()
+    worker._reset_flush_counters()
+
+    worker._event = b'event'
+    worker._write_event_to_database()
+
+    with mock.patch.object(
+            worker._database, 'get_queued_events',
+            side_effect=DatabaseLockedError):
+        worker._flush_queued_events()
+
+    # Retried once the cache is readable, instead of waiting for an event
+    worker._transport.send.assert_not_called()
+    assert 0.4 < worker._next_wakeup() <= 0.5  # queued_events_flush_interval